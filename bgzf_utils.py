@@ -0,0 +1,335 @@
+import gzip
+import io
+import mmap
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from tqdm import tqdm
+
+# =====================
+# BGZF (block gzip) 読み込み
+# =====================
+
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+# 共有ストレージ向けに大きめのバッファで読む
+READ_BUFFER_SIZE = 1 << 20
+
+
+def is_gzip(path):
+    """gzip / bgzip 圧縮ファイルかどうかをマジックナンバーで判定する"""
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def is_bgzf(path):
+    """BGZF (bgzip 圧縮) ファイルかどうかを先頭ブロックのヘッダで判定する"""
+    with open(path, "rb") as f:
+        header = f.read(18)
+    return (
+        len(header) == 18
+        and header[:4] == BGZF_MAGIC
+        and header[12:14] == b"BC"
+    )
+
+
+def make_virtual_offset(block_offset, within_block):
+    return (block_offset << 16) | within_block
+
+
+def split_virtual_offset(virtual_offset):
+    return virtual_offset >> 16, virtual_offset & 0xFFFF
+
+
+class BgzfReader:
+    """
+    Minimal random-access reader for BGZF files.
+
+    Positions are BGZF virtual offsets (compressed block offset << 16 |
+    offset inside the decompressed block), the same convention used by
+    tabix, so offsets from a .tbi index can be passed to seek() directly.
+    """
+
+    def __init__(self, path):
+        self._f = open(path, "rb")
+        self._block_offset = 0
+        self._next_block_offset = 0
+        self._block = b""
+        self._within = 0
+        self._load_block(0)
+
+    def _load_block(self, block_offset):
+        self._f.seek(block_offset)
+        header = self._f.read(18)
+        self._block_offset = block_offset
+        self._within = 0
+
+        if len(header) < 18:
+            # EOF
+            self._block = b""
+            self._next_block_offset = block_offset
+            return False
+        if header[:4] != BGZF_MAGIC:
+            raise ValueError(f"Not a BGZF block at offset {block_offset}")
+
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = header[12:] + self._f.read(xlen - 6)
+        bsize = None
+        pos = 0
+        while pos < xlen:
+            si1, si2, slen = extra[pos], extra[pos + 1], struct.unpack("<H", extra[pos + 2:pos + 4])[0]
+            if si1 == 66 and si2 == 67:  # "BC"
+                bsize = struct.unpack("<H", extra[pos + 4:pos + 6])[0]
+            pos += 4 + slen
+        if bsize is None:
+            raise ValueError(f"Missing BGZF block size at offset {block_offset}")
+
+        cdata = self._f.read(bsize - xlen - 19)
+        self._f.read(8)  # CRC32 + ISIZE
+        self._block = zlib.decompress(cdata, -15)
+        self._next_block_offset = block_offset + bsize + 1
+        return True
+
+    def _advance(self):
+        """次の空でないブロックへ進む。EOF なら False"""
+        while True:
+            if not self._load_block(self._next_block_offset):
+                return False
+            if self._block:
+                return True
+
+    def seek(self, virtual_offset):
+        block_offset, within = split_virtual_offset(virtual_offset)
+        if block_offset != self._block_offset or not self._block:
+            self._load_block(block_offset)
+        self._within = within
+
+    def tell(self):
+        # ブロック末尾は次ブロック先頭として扱う (tabix と同じ規約)
+        if self._within >= len(self._block):
+            return make_virtual_offset(self._next_block_offset, 0)
+        return make_virtual_offset(self._block_offset, self._within)
+
+    def readline(self):
+        parts = []
+        while True:
+            if self._within >= len(self._block):
+                if not self._advance():
+                    break
+            newline = self._block.find(b"\n", self._within)
+            if newline >= 0:
+                parts.append(self._block[self._within:newline + 1])
+                self._within = newline + 1
+                break
+            parts.append(self._block[self._within:])
+            self._within = len(self._block)
+        return b"".join(parts)
+
+    def read(self, size):
+        parts = []
+        while size > 0:
+            if self._within >= len(self._block):
+                if not self._advance():
+                    break
+            chunk = self._block[self._within:self._within + size]
+            self._within += len(chunk)
+            size -= len(chunk)
+            parts.append(chunk)
+        return b"".join(parts)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =====================
+# 圧縮ファイル対応の逐次読み込み
+# =====================
+
+def _decompressed_stream(raw):
+    """raw (バイナリファイル) が gzip なら展開ストリームを、そうでなければ raw を返す"""
+    compressed = raw.read(2) == GZIP_MAGIC
+    raw.seek(0)
+    if compressed:
+        return io.BufferedReader(gzip.GzipFile(fileobj=raw, mode="rb"), READ_BUFFER_SIZE)
+    return raw
+
+
+@contextmanager
+def open_text(path, newline=None):
+    """
+    Open a plain, gzip or bgzip file for text reading.
+
+    Compression is detected from the magic number, not the file name, and
+    the file is read through large buffers.
+    """
+    with open(path, "rb", buffering=READ_BUFFER_SIZE) as raw:
+        stream = _decompressed_stream(raw)
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline=newline)
+        try:
+            yield text
+        finally:
+            text.detach()
+            if stream is not raw:
+                stream.close()
+
+
+def iter_lines(path, desc=None):
+    """
+    Yield text lines of a plain or compressed file.
+
+    If desc is given a progress bar is shown. Progress is measured in bytes
+    of the file on disk (compressed bytes for .gz), so no separate
+    line-counting pass is needed.
+    """
+    if desc is None:
+        with open_text(path) as f:
+            yield from f
+        return
+
+    total = os.path.getsize(path)
+    with open(path, "rb", buffering=READ_BUFFER_SIZE) as raw, \
+            tqdm(total=total, desc=desc, unit="B", unit_scale=True, bar_format="{l_bar}{bar}") as pbar:
+        stream = _decompressed_stream(raw)
+        text = io.TextIOWrapper(stream, encoding="utf-8")
+        try:
+            for i, line in enumerate(text):
+                # 進捗の更新は間引く
+                if not i & 0x3FFF:
+                    pbar.update(raw.tell() - pbar.n)
+                yield line
+            pbar.update(total - pbar.n)
+        finally:
+            text.detach()
+            if stream is not raw:
+                stream.close()
+
+
+def iter_lines_containing(path, needle):
+    """
+    Yield only the text lines that contain needle.
+
+    Uncompressed files are memory-mapped and searched with bytes.find, so
+    only the matching lines are decoded; compressed files are streamed and
+    filtered line by line.
+
+    Args:
+        path: Plain or compressed text file
+        needle: Substring to look for (str)
+    """
+    if is_gzip(path):
+        for line in iter_lines(path, desc="Parsing GFF"):
+            if needle in line:
+                yield line
+        return
+
+    if os.path.getsize(path) == 0:
+        return
+    needle_bytes = needle.encode("utf-8")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = mm.find(needle_bytes)
+        while pos >= 0:
+            line_start = mm.rfind(b"\n", 0, pos) + 1
+            line_end = mm.find(b"\n", pos)
+            line_end = len(mm) if line_end < 0 else line_end + 1
+            yield mm[line_start:line_end].decode("utf-8")
+            # 同じ行内の 2 つ目以降の一致は読み飛ばす
+            pos = mm.find(needle_bytes, line_end)
+
+
+def split_line_ranges(path, n_chunks):
+    """
+    Split an uncompressed file into up to n_chunks byte ranges that start and
+    end on line boundaries.
+
+    Returns:
+        list of (begin, end) byte offsets
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as f:
+        for i in range(1, n_chunks):
+            f.seek(max(size * i // n_chunks, boundaries[-1]))
+            f.readline()  # 行の途中から始まらないよう次の改行まで進める
+            pos = min(f.tell(), size)
+            if pos > boundaries[-1]:
+                boundaries.append(pos)
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def iter_lines_in_range(path, begin, end):
+    """Yield the text lines of an uncompressed file between two byte offsets."""
+    with open(path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        f.seek(begin)
+        pos = begin
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode("utf-8")
+
+
+# =====================
+# tabix (.tbi) 線形インデックス
+# =====================
+
+def read_tabix_linear_index(tbi_path):
+    """
+    Read the per-sequence linear index of a tabix .tbi file.
+
+    Returns:
+        dict: {seqid: [virtual_offset for each 16 kb window]}
+    """
+    with open(tbi_path, "rb") as f:
+        data = gzip.decompress(f.read())
+
+    if data[:4] != b"TBI\x01":
+        raise ValueError(f"Not a tabix index: {tbi_path}")
+
+    n_ref = struct.unpack("<i", data[4:8])[0]
+    l_nm = struct.unpack("<i", data[32:36])[0]
+    names = [n.decode() for n in data[36:36 + l_nm].split(b"\x00") if n]
+    pos = 36 + l_nm
+
+    linear = {}
+    for ref_idx in range(n_ref):
+        n_bin = struct.unpack("<i", data[pos:pos + 4])[0]
+        pos += 4
+        for _ in range(n_bin):
+            n_chunk = struct.unpack("<i", data[pos + 4:pos + 8])[0]
+            pos += 8 + n_chunk * 16
+        n_intv = struct.unpack("<i", data[pos:pos + 4])[0]
+        pos += 4
+        ioff = list(struct.unpack(f"<{n_intv}Q", data[pos:pos + n_intv * 8]))
+        pos += n_intv * 8
+
+        # 先頭の空ウィンドウ (0) は最初に出現するオフセットで埋める
+        # （最初の配列はファイル先頭から始まるため 0 のままで正しい）
+        if ref_idx > 0:
+            next_offset = 0
+            for i in range(len(ioff) - 1, -1, -1):
+                if ioff[i] == 0:
+                    ioff[i] = next_offset
+                else:
+                    next_offset = ioff[i]
+        linear[names[ref_idx]] = ioff
+
+    return linear
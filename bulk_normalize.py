@@ -0,0 +1,147 @@
+import numpy as np
+from gene_classes import GeneFeature
+
+# =====================
+# 一括正規化 (NumPy)
+# =====================
+
+# 正規化で区別する feature type のコード (それ以外は OTHER)
+EXON, CDS, FIVE_PRIME_UTR, THREE_PRIME_UTR, INTRON, OTHER = range(6)
+TYPE_CODES = {
+    'exon': EXON,
+    'CDS': CDS,
+    'five_prime_UTR': FIVE_PRIME_UTR,
+    'three_prime_UTR': THREE_PRIME_UTR,
+    'intron': INTRON,
+}
+UTR_TYPES = ('five_prime_UTR', 'three_prime_UTR')
+
+
+def _feature_table(genes):
+    """全 transcript の feature を 1 つの列テーブルにまとめる"""
+    objects = [f for gene in genes for f in gene.features]
+    counts = np.fromiter((len(gene.features) for gene in genes), dtype=np.int64, count=len(genes))
+    offsets = np.zeros(len(genes) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    gid = np.repeat(np.arange(len(genes), dtype=np.int64), counts)
+    pos = np.arange(len(objects), dtype=np.int64) - offsets[gid]
+    start = np.fromiter((f.start for f in objects), dtype=np.int64, count=len(objects))
+    end = np.fromiter((f.end for f in objects), dtype=np.int64, count=len(objects))
+    code = np.fromiter((TYPE_CODES.get(f.feature_type, OTHER) for f in objects), dtype=np.int8, count=len(objects))
+    return objects, gid, pos, start, end, code
+
+
+def normalize_table(gid, pos, start, end, code, minus):
+    """
+    Normalize a grouped feature table (the vectorized core of normalize_bulk).
+
+    Args:
+        gid: Transcript index of each row
+        pos: Position of the row in its transcript's feature list
+        start, end: Coordinates of each row
+        code: Feature type code of each row (see TYPE_CODES)
+        minus: Per-transcript bool array, True for '-' strand
+
+    Returns:
+        (kept, utrs, introns):
+            kept: Row indices that stay, in table order
+            utrs: (gid, start, end, code) arrays of derived UTRs
+            introns: (gid, start, end) arrays of introns
+        Per transcript the normalized list is kept rows, then UTRs, then
+        introns, each in array order.
+    """
+    n_genes = len(minus)
+    is_exon = code == EXON
+    is_cds = code == CDS
+    is_utr = (code == FIVE_PRIME_UTR) | (code == THREE_PRIME_UTR)
+    has_cds = np.bincount(gid[is_cds], minlength=n_genes) > 0
+    has_utr = np.bincount(gid[is_utr], minlength=n_genes) > 0
+
+    # CDS 全体の範囲 (transcript ごと)
+    cds_start = np.full(n_genes, np.iinfo(np.int64).max, dtype=np.int64)
+    cds_end = np.full(n_genes, np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(cds_start, gid[is_cds], start[is_cds])
+    np.maximum.at(cds_end, gid[is_cds], end[is_cds])
+
+    # --- exon と CDS の差分から UTR を計算 (CDS があり UTR がない transcript のみ) ---
+    ex = np.flatnonzero(is_exon & (has_cds & ~has_utr)[gid])
+    ex = ex[np.lexsort((pos[ex], start[ex], gid[ex]))]
+    eg, es, ee = gid[ex], start[ex], end[ex]
+    cs, ce = cds_start[eg], cds_end[eg]
+
+    # CDS より小さな座標側 (up) と大きな座標側 (down) の部分
+    up_s, up_e = es, np.minimum(ee, cs - 1)
+    up_ok = (es < cs) & (ee >= cs - 1) & (up_s <= up_e)
+    down_s, down_e = np.maximum(es, ce + 1), ee
+    down_ok = (ee > ce) & (es <= ce + 1) & (down_s <= down_e)
+
+    # プラス鎖は up が 5' UTR、マイナス鎖は down が 5' UTR。exon ごとに 5' → 3' の順で並べる
+    m = minus[eg]
+    utr_s = np.stack([np.where(m, down_s, up_s), np.where(m, up_s, down_s)], axis=1).ravel()
+    utr_e = np.stack([np.where(m, down_e, up_e), np.where(m, up_e, down_e)], axis=1).ravel()
+    utr_ok = np.stack([np.where(m, down_ok, up_ok), np.where(m, up_ok, down_ok)], axis=1).ravel()
+    utr_code = np.tile(np.array([FIVE_PRIME_UTR, THREE_PRIME_UTR], dtype=np.int8), len(ex))
+    utr_gid = np.repeat(eg, 2)
+    utr_s, utr_e, utr_code, utr_gid = utr_s[utr_ok], utr_e[utr_ok], utr_code[utr_ok], utr_gid[utr_ok]
+
+    # --- 残す元の feature: CDS がある場合の exon と、既存のイントロンを除く ---
+    keep = (code != INTRON) & ~(is_exon & has_cds[gid])
+
+    # --- イントロン: exon 類を transcript ごとに start 順に並べ、隣接間の隙間を取る ---
+    el = np.flatnonzero(keep & (code <= THREE_PRIME_UTR))
+    el_gid = np.concatenate([gid[el], utr_gid])
+    el_start = np.concatenate([start[el], utr_s])
+    el_end = np.concatenate([end[el], utr_e])
+    # 同じ start の場合は元のリスト順（元の feature → 追加した UTR の順）
+    first_utr_seq = int(pos.max()) + 1 if len(pos) else 0
+    el_seq = np.concatenate([pos[el], first_utr_seq + np.arange(len(utr_s), dtype=np.int64)])
+    order = np.lexsort((el_seq, el_start, el_gid))
+    el_gid, el_start, el_end = el_gid[order], el_start[order], el_end[order]
+
+    intron_s = el_end[:-1] + 1
+    intron_e = el_start[1:] - 1
+    intron_ok = (el_gid[1:] == el_gid[:-1]) & (intron_s <= intron_e)
+
+    return (
+        np.flatnonzero(keep),
+        (utr_gid, utr_s, utr_e, utr_code),
+        (el_gid[:-1][intron_ok], intron_s[intron_ok], intron_e[intron_ok]),
+    )
+
+
+def append_derived_features(genes, new_features, utrs, introns):
+    """normalize_table() が返した UTR とイントロンを GeneFeature として追加する"""
+    for g, s, e, c in zip(*(a.tolist() for a in utrs)):
+        gene = genes[g]
+        new_features[g].append(GeneFeature(gene.seqid, s, e, UTR_TYPES[c - FIVE_PRIME_UTR], gene.strand))
+    for g, s, e in zip(*(a.tolist() for a in introns)):
+        gene = genes[g]
+        new_features[g].append(GeneFeature(gene.seqid, s, e, 'intron', gene.strand))
+
+
+def normalize_bulk(genes):
+    """
+    Vectorized GeneStructure.normalize_features() for many transcripts.
+
+    All features go into one table grouped by transcript. UTRs are derived
+    from the exon and CDS spans of every transcript at once, and introns
+    come from the gaps between consecutive exon-like features within each
+    group. The resulting feature lists (including their order) are the same
+    as those of the per-object path.
+
+    Args:
+        genes: List[GeneStructure], modified in place
+    """
+    objects, gid, pos, start, end, code = _feature_table(genes)
+    minus = np.array([gene.strand == '-' for gene in genes], dtype=bool)
+    kept, utrs, introns = normalize_table(gid, pos, start, end, code, minus)
+
+    # --- transcript ごとの feature リストを組み立てる ---
+    new_features = [[] for _ in genes]
+    for g, i in zip(gid[kept].tolist(), kept.tolist()):
+        new_features[g].append(objects[i])
+    append_derived_features(genes, new_features, utrs, introns)
+
+    for gene, features in zip(genes, new_features):
+        gene.features = features
@@ -71,3 +71,30 @@ DOMAIN_COLOR_PALETTE = [
     "#bcbd22",  # olive
     "#17becf",  # cyan
 ]
+
+# =====================
+# バリアント密度トラック設定
+# =====================
+
+# 1 遺伝子あたりの SNP + 挿入の数がこれを超えると、1 個ずつの記号の代わりに
+# ピクセル列ごとに集計した密度トラックを描く（None で無効）
+VARIANT_DENSITY_THRESHOLD = 2000
+VARIANT_DENSITY_BIN_PX = 1       # 集計単位（ピクセル幅）
+VARIANT_DENSITY_HEIGHT = 12      # トラックの最大の高さ（ピクセル）
+
+# =====================
+# SVG 出力設定
+# =====================
+
+# "string": 文字列を直接組み立てる軽量な出力（既定） / "svgwrite": svgwrite を使う
+SVG_BACKEND = "string"
+# 座標などの小数点以下の桁数（"string" のみ。None で svgwrite と同じ全桁）
+SVG_COORD_PRECISION = 3
+# SNP・挿入・凡例の記号を <defs> の <symbol> に 1 度だけ定義し、<use> で参照する
+SVG_USE_SYMBOLS = True
+# 同じ記号がこの回数使われた時点で <symbol> にする（それまでと、これより少ない記号はその場に描く）
+SVG_SYMBOL_MIN_USES = 3
+# fill / stroke などを要素ごとに書かず、CSS の <style> にクラスとして 1 度だけ定義する
+SVG_CLASS_STYLES = False
+# (region モード) ベースラインと exon / CDS / UTR の四角を、同じスタイルごとにトラックあたり 1 本の <path> にまとめる
+SVG_COALESCE_PATHS = False
@@ -0,0 +1,78 @@
+from bgzf_utils import iter_lines
+
+# =====================
+# ドメイン注釈 (InterProScan TSV / hmmscan domtblout) 読み込み
+# =====================
+
+def load_protein_map(map_file):
+    """
+    Read a two-column protein ID -> transcript ID table (tab or whitespace
+    separated, '#' lines ignored).
+
+    Returns:
+        dict: {protein_id: transcript_id}
+    """
+    protein_map = {}
+    for line in iter_lines(map_file):
+        if line.startswith("#") or not line.strip():
+            continue
+        parts = line.split()
+        if len(parts) >= 2:
+            protein_map[parts[0]] = parts[1]
+    return protein_map
+
+
+def _parse_domain_hit(line):
+    """
+    1 行を (protein_id, start_aa, end_aa, name) に変換する。
+    タブ区切りなら InterProScan TSV、空白区切りなら hmmscan --domtblout とみなす。
+    """
+    if "\t" in line:
+        # InterProScan: protein, md5, length, analysis, signature acc, signature desc, start, stop, ...
+        parts = line.rstrip("\r\n").split("\t")
+        if len(parts) < 8:
+            return None
+        return parts[0], int(parts[6]), int(parts[7]), parts[4]
+
+    # domtblout: target name, acc, tlen, query name, acc, qlen, ..., ali from (18), ali to (19), ...
+    parts = line.split()
+    if len(parts) < 22:
+        return None
+    return parts[3], int(parts[17]), int(parts[18]), parts[0]
+
+
+def load_domain_hits(domain_file, protein_map=None, transcript_ids=None):
+    """
+    Read an InterProScan TSV or hmmscan domtblout file once and group the
+    hits by transcript.
+
+    Args:
+        domain_file: InterProScan TSV / domtblout (plain or gzip)
+        protein_map: {protein_id: transcript_id}; proteins not in the map
+                     are assumed to share their transcript's ID
+        transcript_ids: If given, only hits of these transcripts are kept
+
+    Returns:
+        dict: {transcript_id: [(start_aa, end_aa, name), ...]} sorted by
+              position, in the form taken by
+              GeneStructure.add_domains_from_protein_coords()
+    """
+    protein_map = protein_map or {}
+    wanted = set(transcript_ids) if transcript_ids is not None else None
+    hits = {}
+
+    for line in iter_lines(domain_file, desc="Reading domains"):
+        if line.startswith("#") or not line.strip():
+            continue
+        hit = _parse_domain_hit(line)
+        if hit is None:
+            continue
+        protein_id, start_aa, end_aa, name = hit
+        transcript_id = protein_map.get(protein_id, protein_id)
+        if wanted is not None and transcript_id not in wanted:
+            continue
+        hits.setdefault(transcript_id, []).append((start_aa, end_aa, name))
+
+    for domain_list in hits.values():
+        domain_list.sort()
+    return hits
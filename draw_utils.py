@@ -1,13 +1,18 @@
+import io
 import math
-import svgwrite
+import re
+from collections import Counter
 from typing import List
 from gene_classes import GeneStructure, CoordinateMode
 from parse_utils import get_terminal_feature
 from color_utils import get_or_create_gradient
+from interval_utils import subtract_intervals
 from config import (
     utr_gradation, exon_gradation, domain_gradation,
     FEATURE_COLORS, LEFT_MARGIN, FEATURE_OUTLINES, FEATURE_OUTLINE_WIDTHS,
-    FEATURE_OUTLINE_ENABLED
+    FEATURE_OUTLINE_ENABLED, VARIANT_DENSITY_THRESHOLD, VARIANT_DENSITY_BIN_PX,
+    VARIANT_DENSITY_HEIGHT, SVG_BACKEND, SVG_COORD_PRECISION, SVG_USE_SYMBOLS,
+    SVG_SYMBOL_MIN_USES, SVG_CLASS_STYLES, SVG_COALESCE_PATHS
 )
 
 
@@ -106,30 +111,467 @@ def get_baseline_segments(actual_min_start: int, actual_max_end: int, deletion_r
     if actual_min_start >= actual_max_end:
         return []
     
-    segments = [(actual_min_start, actual_max_end)]
-    
+    deleted = []
     for deletion in deletion_regions:
         if hasattr(deletion, 'start'):
-            del_start, del_end = deletion.start, deletion.end
+            deleted.append((deletion.start, deletion.end))
         elif isinstance(deletion, dict):
-            del_start, del_end = deletion['start'], deletion['end']
+            deleted.append((deletion['start'], deletion['end']))
         elif isinstance(deletion, (list, tuple)) and len(deletion) == 2:
-            del_start, del_end = deletion
+            deleted.append(tuple(deletion))
+
+    segments = subtract_intervals([(actual_min_start, actual_max_end)], deleted)[0]
+
+    return [s for s in segments if s[0] < s[1]]
+
+
+# =====================
+# SVG 出力 (文字列ビルダー)
+# =====================
+
+_ATTR_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'})
+_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+def format_svg_number(value, precision=None) -> str:
+    """
+    float を小数点以下 precision 桁で書き出す（末尾の 0 は省く）。
+    precision が None なら svgwrite と同じく str() のまま。
+    """
+    if precision is None or not isinstance(value, float):
+        return str(value)
+    text = f"{value:.{precision}f}"
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+class SvgElement:
+    """
+    One SVG element of SvgEmitter. Keyword arguments follow svgwrite
+    (stroke_width -> stroke-width).
+    """
+
+    __slots__ = ('tag', 'attribs', 'text', 'elements')
+
+    def __init__(self, tag, text=None, **attribs):
+        self.tag = tag
+        self.text = text
+        self.elements = []
+        self.attribs = {}
+        self.update(attribs)
+
+    def update(self, attribs):
+        for key, value in attribs.items():
+            self.attribs[key.rstrip('_').replace('_', '-')] = value
+
+    def __setitem__(self, key, value):
+        self.attribs[key] = value
+
+    def __getitem__(self, key):
+        return self.attribs[key]
+
+    def add(self, element):
+        self.elements.append(element)
+        return element
+
+    def add_stop_color(self, offset=None, color=None, opacity=None):
+        """linearGradient 用（svgwrite と同じ引数）"""
+        stop = SvgElement('stop')
+        if offset is not None:
+            stop['offset'] = offset
+        if color is not None:
+            stop['stop-color'] = color
+        if opacity is not None:
+            stop['stop-opacity'] = opacity
+        self.elements.append(stop)
+        return self
+
+    def write_start(self, out, precision=None):
+        """開始タグを '>' の手前まで書き出す（属性は svgwrite と同じく名前順）"""
+        out.write('<' + self.tag)
+        for key in sorted(self.attribs):
+            value = self.attribs[key]
+            if value is None:
+                continue
+            if key == 'points':
+                value = ' '.join(
+                    f"{format_svg_number(x, precision)},{format_svg_number(y, precision)}" for x, y in value
+                )
+            else:
+                value = format_svg_number(value, precision)
+            if value:
+                out.write(f' {key}="{value.translate(_ATTR_ESCAPES)}"')
+
+    def write(self, out, precision=None):
+        """要素を XML 文字列として out に書き出す"""
+        self.write_start(out, precision)
+        if self.text is None and not self.elements:
+            out.write(' />')
+            return
+        out.write('>')
+        if self.text is not None:
+            out.write(str(self.text).translate(_TEXT_ESCAPES))
+        for element in self.elements:
+            element.write(out, precision)
+        out.write(f'</{self.tag}>')
+
+
+class SvgStyle(SvgElement):
+    """<style> 要素（CSS は CDATA として書き出す）"""
+
+    __slots__ = ()
+
+    def write(self, out, precision=None):
+        self.write_start(out, precision)
+        out.write(f'><![CDATA[{self.text}]]></{self.tag}>')
+
+
+class SvgEmitter:
+    """
+    Lightweight replacement for the part of svgwrite.Drawing used by the
+    drawing functions.
+
+    Elements are serialized into an in-memory buffer as soon as they are
+    added, without building or validating an object tree (groups are kept
+    until save() so that content can still be added to them). With
+    precision=None the output is byte-identical to svgwrite; otherwise
+    floats are written with that many decimal places.
+
+    Args:
+        filename: Path written by save()
+        size: (width, height) of the canvas
+        precision: Decimal places of float values, or None for full precision
+    """
+
+    def __init__(self, filename, size=None, precision=None):
+        self.filename = filename
+        self.precision = precision
+        self.attribs = {
+            'baseProfile': 'full',
+            'version': '1.1',
+            'xmlns': 'http://www.w3.org/2000/svg',
+            'xmlns:ev': 'http://www.w3.org/2001/xml-events',
+            'xmlns:xlink': 'http://www.w3.org/1999/xlink',
+        }
+        if size is not None:
+            self.attribs['width'], self.attribs['height'] = size
+        self.defs = SvgElement('defs')
+        self._body = io.StringIO()
+        self._parts = []  # 書き出し済みの文字列バッファと、保存時に書き出すグループ
+
+    def __setitem__(self, key, value):
+        self.attribs[key] = value
+
+    def __getitem__(self, key):
+        return self.attribs[key]
+
+    def add(self, element):
+        if element.tag == 'g':
+            self._parts.append(self._body)
+            self._parts.append(element)
+            self._body = io.StringIO()
         else:
-            continue
-            
-        new_segments = []
-        for seg_start, seg_end in segments:
-            if seg_end < del_start or seg_start > del_end:
-                new_segments.append((seg_start, seg_end))
+            element.write(self._body, self.precision)
+        return element
+
+    # --- svgwrite.Drawing と同じ名前の要素ファクトリ ---
+    def line(self, start, end, **extra):
+        return SvgElement('line', x1=start[0], y1=start[1], x2=end[0], y2=end[1], **extra)
+
+    def rect(self, insert, size, **extra):
+        return SvgElement('rect', x=insert[0], y=insert[1], width=size[0], height=size[1], **extra)
+
+    def polygon(self, points, **extra):
+        return SvgElement('polygon', points=list(points), **extra)
+
+    def polyline(self, points, **extra):
+        return SvgElement('polyline', points=list(points), **extra)
+
+    def text(self, text, insert, **extra):
+        return SvgElement('text', text=text, x=insert[0], y=insert[1], **extra)
+
+    def path(self, d=None, **extra):
+        return SvgElement('path', d=d, **extra)
+
+    def g(self, **extra):
+        return SvgElement('g', **extra)
+
+    def style(self, content="", **extra):
+        return SvgStyle('style', text=content, type="text/css", **extra)
+
+    def symbol(self, **extra):
+        return SvgElement('symbol', **extra)
+
+    def use(self, href, insert=None, **extra):
+        element = SvgElement('use', **extra)
+        element['xlink:href'] = href
+        if insert is not None:
+            element['x'], element['y'] = insert
+        return element
+
+    def linearGradient(self, start=None, end=None, **extra):
+        gradient = SvgElement('linearGradient', **extra)
+        if start is not None:
+            gradient['x1'], gradient['y1'] = start
+        if end is not None:
+            gradient['x2'], gradient['y2'] = end
+        return gradient
+
+    def tostring(self) -> str:
+        out = io.StringIO()
+        root = SvgElement('svg')
+        root.attribs = self.attribs
+        root.write_start(out, self.precision)
+        out.write('>')
+        self.defs.write(out, self.precision)
+        for part in self._parts:
+            if isinstance(part, SvgElement):
+                part.write(out, self.precision)
             else:
-                if seg_start < del_start:
-                    new_segments.append((seg_start, del_start - 1))
-                if seg_end > del_end:
-                    new_segments.append((del_end + 1, seg_end))
-        segments = new_segments
-        
-    return [s for s in segments if s[0] < s[1]]
+                out.write(part.getvalue())
+        out.write(self._body.getvalue())
+        out.write('</svg>')
+        return out.getvalue()
+
+    def save(self):
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+            f.write(self.tostring())
+
+
+def new_drawing(output_svg: str, size: tuple):
+    """
+    config.SVG_BACKEND に応じて描画先を作る。
+    "string" は SvgEmitter、"svgwrite" は svgwrite.Drawing（svgwrite は必要な場合のみ import）
+    """
+    if SVG_BACKEND == "svgwrite":
+        import svgwrite
+        return svgwrite.Drawing(output_svg, size=size)
+    return SvgEmitter(output_svg, size=size, precision=SVG_COORD_PRECISION)
+
+
+# =====================
+# クラス指定のスタイル (<style>)
+# =====================
+
+class StyleClasses:
+    """
+    Collects the presentation attributes of a drawing into CSS classes.
+
+    attrs() returns the keyword arguments to pass to an element: the paint
+    attributes themselves when disabled, otherwise a class whose rule is
+    written once into a <style> block by write_to(). Classes are named after
+    the feature type; another paint under the same name gets a numbered class
+    (e.g. one class per domain colour).
+
+    Args:
+        enabled: False keeps inline attributes (output unchanged)
+        precision: Decimal places of float values in the rules
+    """
+
+    def __init__(self, enabled, precision=None):
+        self.enabled = enabled
+        self.precision = precision
+        self._classes = {}  # (name, paint) -> class 名
+        self._rules = []    # (class 名, paint)
+
+    def attrs(self, name, **paint):
+        if not self.enabled:
+            return paint
+        key = (name, tuple(sorted(paint.items())))
+        class_name = self._classes.get(key)
+        if class_name is None:
+            base = re.sub(r'[^A-Za-z0-9_-]', '_', name)
+            used = set(self._classes.values())
+            class_name, n = base, 2
+            while class_name in used:
+                class_name, n = f"{base}-{n}", n + 1
+            self._classes[key] = class_name
+            self._rules.append((class_name, paint))
+        return {'class_': class_name}
+
+    def write_to(self, dwg):
+        """集めたクラスを <style> として defs に追加する（保存の直前に呼ぶ）"""
+        if not self._rules:
+            return
+        rules = []
+        for class_name, paint in self._rules:
+            declarations = ';'.join(
+                f"{key.rstrip('_').replace('_', '-')}:{format_svg_number(value, self.precision)}"
+                for key, value in paint.items()
+            )
+            rules.append(f".{class_name}{{{declarations}}}")
+        dwg.defs.add(dwg.style(''.join(rules)))
+
+
+# =====================
+# 同じスタイルの図形を 1 本の <path> にまとめる
+# =====================
+
+class PathCoalescer:
+    """
+    Merges shapes that share a style into one <path> per (track, layer,
+    style), with each shape as a subpath of the path's d string.
+
+    Layers keep the stacking order: flush() writes lower layers of a track
+    first, so the baseline (layer 0) stays under the exon/CDS/UTR boxes
+    (layer 1), as with individual elements.
+
+    Args:
+        precision: Decimal places of coordinates in d
+    """
+
+    def __init__(self, precision=None):
+        self.precision = precision
+        self._paths = {}  # (track, layer, paint) -> (paint, [subpath, ...])
+
+    def _subpaths(self, track, layer, paint):
+        key = (track, layer, tuple(sorted(paint.items())))
+        entry = self._paths.get(key)
+        if entry is None:
+            entry = self._paths[key] = (paint, [])
+        return entry[1]
+
+    def _num(self, value):
+        return format_svg_number(value, self.precision)
+
+    def add_line(self, track, layer, paint, x1, x2, y):
+        """水平線 (x1, y)-(x2, y)"""
+        self._subpaths(track, layer, paint).append(f"M{self._num(x1)},{self._num(y)}H{self._num(x2)}")
+
+    def add_rect(self, track, layer, paint, x, y, width, height):
+        # 幅 0 以下の rect は描画されないので、path でも描かない
+        if width <= 0 or height <= 0:
+            return
+        self._subpaths(track, layer, paint).append(
+            f"M{self._num(x)},{self._num(y)}h{self._num(width)}v{self._num(height)}h{self._num(-width)}Z"
+        )
+
+    def add_polygon(self, track, layer, paint, points):
+        self._subpaths(track, layer, paint).append(
+            'M' + 'L'.join(f"{self._num(x)},{self._num(y)}" for x, y in points) + 'Z'
+        )
+
+    def flush(self, dwg, container):
+        """まとめた path を container に追加する（トラック・層の順。同じ層の中は最初に現れた順）"""
+        for (track, layer, _), (paint, subpaths) in sorted(self._paths.items(), key=lambda item: item[0][:2]):
+            container.add(dwg.path(d=''.join(subpaths), **paint))
+        self._paths = {}
+
+
+# =====================
+# 繰り返し描く記号 (SNP / 挿入 / デリーション / 凡例)
+# =====================
+# paint は fill / stroke などの属性（StyleClasses.attrs() の戻り値）
+
+def snp_tick(dwg, x, y, length, paint):
+    """(x, y) から下に length 伸びる SNP の縦線"""
+    return [dwg.line(start=(x, y), end=(x, y + length), **paint)]
+
+
+def insertion_triangle(dwg, x, y, half_width, height, paint):
+    """上辺が y、頂点が (x, y + height) の挿入の逆三角形"""
+    return [dwg.polygon(points=[(x - half_width, y), (x + half_width, y), (x, y + height)], **paint)]
+
+
+def deletion_chevron(dwg, x, y, width, depth, paint):
+    """(x, y) から width だけ右へ、depth の高さで折れるデリーションのくの字"""
+    return [dwg.polyline(points=[(x, y), (x + width / 2, y - depth), (x + width, y)], **paint)]
+
+
+def legend_swatch(dwg, x, y, size, paint):
+    """凡例の四角"""
+    return [dwg.rect(insert=(x, y), size=(size, size), **paint)]
+
+
+def add_glyph(dwg, symbols, key, x, y, build):
+    """
+    build(x, y) が返す要素を (x, y) に描く。
+    symbols (dict) を渡すと、同じ key の記号が SVG_SYMBOL_MIN_USES 回目に使われた時点で
+    原点基準の <symbol> を defs に 1 度だけ登録し、以降は <use> で参照する。
+    それより少ない記号は <symbol> の定義分だけファイルが大きくなるので、その場に書き出す。
+    symbols が None なら常にその場に書き出す。
+    """
+    if symbols is not None:
+        entry = symbols.get(key)
+        if entry is None:
+            # [symbol ID, 使用回数]
+            entry = symbols[key] = [f'sym_{len(symbols)}', 0]
+        entry[1] += 1
+        if entry[1] >= SVG_SYMBOL_MIN_USES:
+            symbol_id = entry[0]
+            if entry[1] == SVG_SYMBOL_MIN_USES:
+                # 原点の左や上にはみ出す部分も描けるよう overflow は visible にする
+                symbol = dwg.symbol(id=symbol_id, overflow='visible')
+                for element in build(0, 0):
+                    symbol.add(element)
+                dwg.defs.add(symbol)
+            dwg.add(dwg.use(f'#{symbol_id}', insert=(x, y)))
+            return
+
+    for element in build(x, y):
+        dwg.add(element)
+
+
+# =====================
+# バリアント密度トラック
+# =====================
+
+def use_variant_density(gene) -> bool:
+    """SNP + 挿入の数がしきい値を超え、密度トラックで描くべきか"""
+    if VARIANT_DENSITY_THRESHOLD is None:
+        return False
+    count = len(getattr(gene, "snps", [])) + len(getattr(gene, "insertions", []))
+    return count > VARIANT_DENSITY_THRESHOLD
+
+
+def get_variant_density(variants, origin: int, bin_width: float) -> List[tuple]:
+    """
+    Count variants per bin of bin_width bp starting at origin.
+
+    Returns:
+        List[tuple]: (bin_index, count) for the non-empty bins, in order
+    """
+    # VariantStore (numpy) は配列のまま集計する
+    if hasattr(variants, 'histogram'):
+        return variants.histogram(origin, bin_width)
+
+    counts = Counter(
+        math.floor(((v.position if hasattr(v, 'position') else v) - origin) / bin_width)
+        for v in variants
+    )
+    return sorted(counts.items())
+
+
+def draw_variant_density(dwg, styles, gene, origin: int, y_base: float, shrink_factor: float, scale: float):
+    """
+    SNP と挿入をピクセル列ごとに集計し、y_base から上に伸びる積み上げ棒で描く。
+    要素数は描画幅（ピクセル列数）で頭打ちになるため、バリアント数によらず SVG の大きさが一定に収まる。
+    """
+    bin_px = VARIANT_DENSITY_BIN_PX
+    bin_width = bin_px * shrink_factor / scale
+    snp_counts = dict(get_variant_density(getattr(gene, "snps", []), origin, bin_width))
+    ins_counts = dict(get_variant_density(getattr(gene, "insertions", []), origin, bin_width))
+
+    columns = sorted(set(snp_counts) | set(ins_counts))
+    if not columns:
+        return
+    max_count = max(snp_counts.get(c, 0) + ins_counts.get(c, 0) for c in columns)
+    unit = VARIANT_DENSITY_HEIGHT / max_count
+
+    snp_paint = styles.attrs('snp_density', fill=FEATURE_COLORS.get('snp', 'black'), stroke='none')
+    ins_paint = styles.attrs('insertion_density', fill=FEATURE_COLORS.get('insertion', 'black'), stroke='none')
+    for column in columns:
+        x = LEFT_MARGIN + column * bin_px
+        y = y_base
+        # SNP を下段、挿入を上段に積む（0 でなければ最低 1px は見えるようにする）
+        for count, paint in ((snp_counts.get(column, 0), snp_paint), (ins_counts.get(column, 0), ins_paint)):
+            if not count:
+                continue
+            height = max(1, count * unit)
+            y -= height
+            dwg.add(dwg.rect(insert=(x, y), size=(bin_px, height), **paint))
 
 
 # 描画関数
@@ -155,8 +597,12 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
     canvas_width = LEFT_MARGIN + (range_bp / shrink_factor) * scale + extra_padding + 300
     canvas_height = 300 + axis_height
 
-    dwg = svgwrite.Drawing(output_svg, size=(canvas_width, canvas_height))
+    dwg = new_drawing(output_svg, (canvas_width, canvas_height))
     grad_dict = {}
+    # 繰り返し描く記号を <symbol>/<use> にまとめる場合の登録先
+    symbols = {} if SVG_USE_SYMBOLS else None
+    # fill / stroke などを CSS クラスにまとめる場合は <style> に書き出す
+    styles = StyleClasses(SVG_CLASS_STYLES, SVG_COORD_PRECISION)
     y_pos = 50 + axis_height
     height_feature = 15
     max_x_coord = LEFT_MARGIN + (range_bp / shrink_factor) * scale
@@ -171,8 +617,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
         dwg.add(dwg.line(
             start=(x_axis_start, axis_y),
             end=(x_axis_end, axis_y),
-            stroke='black',
-            stroke_width=1
+            **styles.attrs('axis', stroke='black', stroke_width=1)
         ))
 
         # 目盛りの計算
@@ -203,8 +648,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
             dwg.add(dwg.line(
                 start=(x, axis_y),
                 end=(x, axis_y + 5),
-                stroke='black',
-                stroke_width=1
+                **styles.attrs('axis', stroke='black', stroke_width=1)
             ))
 
             # ラベル
@@ -226,13 +670,11 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
             dwg.add(dwg.text(
                 tick_label,
                 insert=(x, axis_y - 5),
-                font_size='9px',
-                fill='black',
-                text_anchor='middle'
+                **styles.attrs('tick_label', font_size='9px', fill='black', text_anchor='middle')
             ))
 
     # イントロン風のベースラインを描画 (デリーション領域を避ける)
-    deletion_list = [f for f in all_features if f.feature_type == 'deletion']
+    deletion_list = gene.get_features_by_type('deletion')
     baseline_segments = get_baseline_segments(actual_min_start, actual_max_end, deletion_list)
     y_line = y_pos + height_feature // 2
     for seg_start, seg_end in baseline_segments:
@@ -242,8 +684,8 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
             dwg.line(
                 start=(x_base_start, y_line),
                 end=(x_base_end, y_line),
-                stroke=FEATURE_COLORS.get('intron', 'black'),
-                stroke_width=FEATURE_OUTLINE_WIDTHS.get('intron', 1)
+                **styles.attrs('intron', stroke=FEATURE_COLORS.get('intron', 'black'),
+                               stroke_width=FEATURE_OUTLINE_WIDTHS.get('intron', 1))
             )
         )
 
@@ -258,23 +700,13 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
         if feat.feature_type == 'deletion':
             # くの字型の折れ線
             y_line = y_pos + height_feature // 2
-            mid_x = x_start + (x_end - x_start) / 2
             offset = 10  # くの字の高さ
             del_color = FEATURE_COLORS.get('deletion', 'black')
             if del_color == 'none': del_color = 'black'
-            dwg.add(
-                dwg.polyline(
-                    points=[
-                        (x_start, y_line),
-                        (mid_x, y_line - offset),
-                        (x_end, y_line)
-                    ],
-                    fill='none',
-                    stroke=del_color,
-                    stroke_width=1,
-                    stroke_dasharray="2,2"
-                )
-            )
+            paint = styles.attrs('deletion', fill='none', stroke=del_color, stroke_width=1, stroke_dasharray="2,2")
+            # 幅がほぼ毎回異なり <symbol> で再利用できないので、その場に描く
+            for element in deletion_chevron(dwg, x_start, y_line, width, offset, paint):
+                dwg.add(element)
         elif feat.feature_type in ('exon', 'CDS', 'five_prime_UTR', 'three_prime_UTR'):
             base_color = FEATURE_COLORS.get(feat.feature_type, 'gray')
             fill_color = base_color
@@ -287,14 +719,13 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
 
             stroke_color = FEATURE_OUTLINES.get(feat.feature_type, 'black')
             stroke_width = FEATURE_OUTLINE_WIDTHS.get(feat.feature_type, 1)
+            paint = styles.attrs(feat.feature_type, fill=fill_color, stroke=stroke_color, stroke_width=stroke_width)
 
             if feat is terminal_feature:
                 dwg.add(
                     dwg.polygon(
                         points=get_terminal_polygon_points(x_start, x_end, y_pos, height_feature),
-                        fill=fill_color,
-                        stroke=stroke_color,
-                        stroke_width=stroke_width
+                        **paint
                     )
                 )
             else:
@@ -303,9 +734,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
                     dwg.rect(
                         insert=(x_start, y_pos),
                         size=(width, height_feature),
-                        fill=fill_color,
-                        stroke=stroke_color,
-                        stroke_width=stroke_width
+                        **paint
                     )
                 )
         elif feat.feature_type == 'intron':
@@ -316,7 +745,12 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
     triangle_height = 6
     y_triangle = y_pos - 8  # exon の少し上
 
-    for ins in getattr(gene, "insertions", []):
+    # バリアントが多すぎる場合は 1 個ずつではなく密度トラックで描く
+    density_mode = use_variant_density(gene)
+    if density_mode:
+        draw_variant_density(dwg, styles, gene, actual_min_start, y_pos - 2, shrink_factor, scale)
+
+    for ins in ([] if density_mode else getattr(gene, "insertions", [])):
         if hasattr(ins, 'position'):
             ins_pos = ins.position
             ins_length = getattr(ins, 'length', 1)
@@ -329,18 +763,9 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
         # 挿入の長さに応じて幅を計算
         base_width = get_insertion_base_width(ins_length, shrink_factor, scale)
 
-        dwg.add(
-            dwg.polygon(
-                points=[
-                    (x - base_width / 2, y_triangle),
-                    (x + base_width / 2, y_triangle),
-                    (x, y_triangle + triangle_height)
-                ],
-                fill=ins_color,
-                stroke=ins_color,
-                stroke_width=1.5
-            )
-        )
+        paint = styles.attrs('insertion', fill=ins_color, stroke=ins_color, stroke_width=1.5)
+        add_glyph(dwg, symbols, ('insertion', base_width, ins_color), x, y_triangle,
+                  lambda x, y: insertion_triangle(dwg, x, y, base_width / 2, triangle_height, paint))
     
     # === SNPs ===
     snp_extend_up = 8     # 上にどれだけ伸ばすか
@@ -349,7 +774,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
     y_snp_top = y_pos - snp_extend_up
     y_snp_bottom = y_pos + height_feature + snp_extend_down
 
-    for snp in getattr(gene, "snps", []):
+    for snp in ([] if density_mode else getattr(gene, "snps", [])):
         if hasattr(snp, 'position'):
             snp_pos = snp.position
         else:
@@ -357,14 +782,9 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
 
         snp_color = FEATURE_COLORS.get('snp', 'black')
         x = LEFT_MARGIN + (snp_pos + shift) / shrink_factor * scale
-        dwg.add(
-            dwg.line(
-                start=(x, y_snp_top),
-                end=(x, y_snp_bottom),
-                stroke=snp_color,
-                stroke_width=1.2
-            )
-        )
+        paint = styles.attrs('snp', stroke=snp_color, stroke_width=1.2)
+        add_glyph(dwg, symbols, ('snp', y_snp_bottom - y_snp_top, snp_color), x, y_snp_top,
+                  lambda x, y: snp_tick(dwg, x, y, y_snp_bottom - y_snp_top, paint))
 
     # domain
     for feat in all_features:
@@ -381,9 +801,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
                 dwg.rect(
                     insert=(x_start, y_pos),
                     size=(width, height_feature),
-                    fill=domain_color,
-                    stroke='black',
-                    stroke_width=1
+                    **styles.attrs('domain', fill=domain_color, stroke='black', stroke_width=1)
                 )
             )
 
@@ -422,58 +840,28 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
         # === Deletion ===
         if feat_key == 'deletion':
             y_mid = y_legend + box_size // 2
-            x0 = legend_x
-            x1 = legend_x + box_size // 2
-            x2 = legend_x + box_size
 
             del_color = FEATURE_COLORS.get('deletion', 'black')
             if del_color == 'none': del_color = 'black'
-            dwg.add(
-                dwg.polyline(
-                    points=[
-                        (x0, y_mid),
-                        (x1, y_mid - 6),
-                        (x2, y_mid)
-                    ],
-                    fill="none",
-                    stroke=del_color,
-                    stroke_width=1.5,
-                    stroke_dasharray="2,2"
-                )
-            )
+            paint = styles.attrs('legend_deletion', fill="none", stroke=del_color, stroke_width=1.5, stroke_dasharray="2,2")
+            add_glyph(dwg, symbols, ('legend_deletion', del_color), legend_x, y_mid,
+                      lambda x, y: deletion_chevron(dwg, x, y, box_size, 6, paint))
 
         # === Insertion ===
         elif feat_key == 'insertion':
             y_mid = y_legend + box_size // 2
-            x0 = legend_x
-            x1 = legend_x + box_size // 2
-            x2 = legend_x + box_size
 
             ins_color = FEATURE_COLORS.get('insertion', 'black')
-            dwg.add(
-                dwg.polygon(
-                    points=[
-                        (x0, y_mid - 4),
-                        (x2, y_mid - 4),
-                        (x1, y_mid + 4)
-                    ],
-                    fill=ins_color,
-                    stroke=ins_color,
-                    stroke_width=1.5
-                )
-            )
+            paint = styles.attrs('insertion', fill=ins_color, stroke=ins_color, stroke_width=1.5)
+            add_glyph(dwg, symbols, ('legend_insertion', ins_color), legend_x + box_size // 2, y_mid - 4,
+                      lambda x, y: insertion_triangle(dwg, x, y, box_size // 2, 8, paint))
 
         # === SNP ===
         elif feat_key == 'snp':
             snp_color = FEATURE_COLORS.get('snp', 'black')
-            dwg.add(
-                dwg.line(
-                    start=(legend_x + box_size // 2, y_legend),
-                    end=(legend_x + box_size // 2, y_legend + box_size),
-                    stroke=snp_color,
-                    stroke_width=1.2
-                )
-            )
+            paint = styles.attrs('snp', stroke=snp_color, stroke_width=1.2)
+            add_glyph(dwg, symbols, ('snp', box_size, snp_color), legend_x + box_size // 2, y_legend,
+                      lambda x, y: snp_tick(dwg, x, y, box_size, paint))
 
 
         # === Intron ===
@@ -483,8 +871,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
                 dwg.line(
                     start=(legend_x, y_line),
                     end=(legend_x + box_size, y_line),
-                    stroke=FEATURE_COLORS.get('intron', 'black'),
-                    stroke_width=1
+                    **styles.attrs('legend_intron', stroke=FEATURE_COLORS.get('intron', 'black'), stroke_width=1)
                 )
             )
 
@@ -504,23 +891,16 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
             if use_grad:
                 fill_color = f'url(#{get_or_create_gradient(dwg, base_color, grad_dict)})'
 
-            dwg.add(
-                dwg.rect(
-                    insert=(legend_x, y_legend),
-                    size=(box_size, box_size),
-                    fill=fill_color,
-                    stroke="black",
-                    stroke_width=1
-                )
-            )
+            paint = styles.attrs(feat_key, fill=fill_color, stroke="black", stroke_width=1)
+            add_glyph(dwg, symbols, ('swatch', fill_color), legend_x, y_legend,
+                      lambda x, y: legend_swatch(dwg, x, y, box_size, paint))
 
         # ラベル
         dwg.add(
             dwg.text(
                 label,
                 insert=(legend_x + box_size + 6, y_legend + box_size - 2),
-                font_size="11px",
-                fill="black"
+                **styles.attrs('legend_label', font_size="11px", fill="black")
             )
     )
 
@@ -534,6 +914,7 @@ def draw_gene_structure(gene, output_svg, scale=2, extra_padding=100, shrink_fac
     # SVG の高さを更新
     dwg['height'] = final_canvas_height
 
+    styles.write_to(dwg)
     dwg.save()
 
 
@@ -618,13 +999,17 @@ def draw_region_gene_structures(
     canvas_height = top_margin + num_tracks * (track_height + gene_spacing) + 150
 
     # メモリ上にSVGを作成
-    dwg = svgwrite.Drawing(output_svg, size=(canvas_width, canvas_height))
+    dwg = new_drawing(output_svg, (canvas_width, canvas_height))
     grad_dict = {}
+    # 繰り返し描く記号を <symbol>/<use> にまとめる場合の登録先
+    symbols = {} if SVG_USE_SYMBOLS else None
+    # fill / stroke などを CSS クラスにまとめる場合は <style> に書き出す
+    styles = StyleClasses(SVG_CLASS_STYLES, SVG_COORD_PRECISION)
 
     # 座標軸を描画（上部）
     if coordinate_mode:
         axis_y = top_margin - 20
-        dwg.add(dwg.line(start=(LEFT_MARGIN, axis_y), end=(LEFT_MARGIN + axis_width, axis_y), stroke='black', stroke_width=1))
+        dwg.add(dwg.line(start=(LEFT_MARGIN, axis_y), end=(LEFT_MARGIN + axis_width, axis_y), **styles.attrs('axis', stroke='black', stroke_width=1)))
 
         # 目盛りを描画
         tick_interval, unit_label, divisor = get_tick_params(range_bp, shrink_factor, scale)
@@ -636,7 +1021,7 @@ def draw_region_gene_structures(
                 continue
             x = LEFT_MARGIN + (tick_pos - draw_start) / shrink_factor * scale
             # 目盛り線
-            dwg.add(dwg.line(start=(x, axis_y), end=(x, axis_y + 5), stroke='black', stroke_width=1))
+            dwg.add(dwg.line(start=(x, axis_y), end=(x, axis_y + 5), **styles.attrs('axis', stroke='black', stroke_width=1)))
 
             # ラベル (coordinate_mode に応じて表示値を変える)
             if coordinate_mode == "relative":
@@ -649,7 +1034,14 @@ def draw_region_gene_structures(
                 tick_label = f"{display_tick_val} {unit_label}"
             else:
                 tick_label = f"{display_tick_val // divisor} {unit_label}"
-            dwg.add(dwg.text(tick_label, insert=(x, axis_y - 3), font_size='9px', fill='black', text_anchor='middle'))
+            dwg.add(dwg.text(tick_label, insert=(x, axis_y - 3), **styles.attrs('tick_label', font_size='9px', fill='black', text_anchor='middle')))
+
+    # 同じスタイルのベースラインと exon 類をトラックごとに 1 本の <path> にまとめる場合は、
+    # 最背面のグループに最後にまとめて書き出す
+    paths = None
+    if SVG_COALESCE_PATHS:
+        paths = PathCoalescer(SVG_COORD_PRECISION)
+        structure_layer = dwg.add(dwg.g())
 
     # 各遺伝子を描画
     for gene_info, track_idx in gene_track_assignments:
@@ -666,14 +1058,19 @@ def draw_region_gene_structures(
 
         terminal_feature = get_terminal_feature(all_features, strand=gene.strand)
         
-        deletion_list = [f for f in all_features if f.feature_type == 'deletion']
+        deletion_list = gene.get_features_by_type('deletion')
         # イントロン風のベースラインを描画 (デリーション領域を避ける)
         baseline_segments = get_baseline_segments(max(draw_start, gene_info['start']), min(draw_end, gene_info['end']), deletion_list)
         y_line = y_pos + height_feature // 2
         for s_start, s_end in baseline_segments:
             xb_start = LEFT_MARGIN + (s_start - draw_start) / shrink_factor * scale
             xb_end = LEFT_MARGIN + (s_end - draw_start) / shrink_factor * scale
-            dwg.add(dwg.line(start=(xb_start, y_line), end=(xb_end, y_line), stroke=FEATURE_COLORS.get('intron', 'black'), stroke_width=FEATURE_OUTLINE_WIDTHS.get('intron', 1)))
+            if paths is not None:
+                # path は既定で塗りつぶされるので fill を none にする
+                paint = styles.attrs('intron', fill='none', stroke=FEATURE_COLORS.get('intron', 'black'), stroke_width=FEATURE_OUTLINE_WIDTHS.get('intron', 1))
+                paths.add_line(track_idx, 0, paint, xb_start, xb_end, y_line)
+                continue
+            dwg.add(dwg.line(start=(xb_start, y_line), end=(xb_end, y_line), **styles.attrs('intron', stroke=FEATURE_COLORS.get('intron', 'black'), stroke_width=FEATURE_OUTLINE_WIDTHS.get('intron', 1))))
 
         # フィーチャーを描画（ドメイン以外）
         for feat in all_features:
@@ -685,11 +1082,13 @@ def draw_region_gene_structures(
             if feat.feature_type == 'domain': continue
             if feat.feature_type == 'deletion':
                 # くの字型の折れ線
-                mid_x = x_start + width / 2
                 offset = 10
                 del_color = FEATURE_COLORS.get('deletion', 'black')
                 if del_color == 'none': del_color = 'black'
-                dwg.add(dwg.polyline(points=[(x_start, y_line), (mid_x, y_line - offset), (x_end, y_line)], fill='none', stroke=del_color, stroke_width=1, stroke_dasharray="2,2"))
+                paint = styles.attrs('deletion', fill='none', stroke=del_color, stroke_width=1, stroke_dasharray="2,2")
+                # 幅がほぼ毎回異なり <symbol> で再利用できないので、その場に描く
+                for element in deletion_chevron(dwg, x_start, y_line, width, offset, paint):
+                    dwg.add(element)
             elif feat.feature_type in ('exon', 'CDS', 'five_prime_UTR', 'three_prime_UTR'):
                 base_color = FEATURE_COLORS.get(feat.feature_type, 'gray')
                 fill_color = base_color
@@ -702,25 +1101,34 @@ def draw_region_gene_structures(
                 
                 stroke_color = FEATURE_OUTLINES.get(feat.feature_type, 'black')
                 stroke_width = FEATURE_OUTLINE_WIDTHS.get(feat.feature_type, 1)
-
-                if feat is terminal_feature:
+                paint = styles.attrs(feat.feature_type, fill=fill_color, stroke=stroke_color, stroke_width=stroke_width)
+
+                if paths is not None:
+                    if feat is terminal_feature:
+                        paths.add_polygon(track_idx, 1, paint, get_terminal_polygon_points(x_start, x_end, y_pos, height_feature, gene.strand))
+                    else:
+                        paths.add_rect(track_idx, 1, paint, x_start, y_pos, width, height_feature)
+                elif feat is terminal_feature:
                     dwg.add(
                         dwg.polygon(
                             points=get_terminal_polygon_points(x_start, x_end, y_pos, height_feature, gene.strand),
-                            fill=fill_color,
-                            stroke=stroke_color,
-                            stroke_width=stroke_width
+                            **paint
                         )
                     )
                 else:
                     # 通常の四角
-                    dwg.add(dwg.rect(insert=(x_start, y_pos), size=(width, height_feature), fill=fill_color, stroke=stroke_color, stroke_width=stroke_width))
+                    dwg.add(dwg.rect(insert=(x_start, y_pos), size=(width, height_feature), **paint))
 
         # === Insertions ===
         triangle_height = 6
         y_triangle = y_pos - 8
 
-        for ins in getattr(gene, "insertions", []):
+        # バリアントが多すぎる場合は 1 個ずつではなく密度トラックで描く
+        density_mode = use_variant_density(gene)
+        if density_mode:
+            draw_variant_density(dwg, styles, gene, draw_start, y_pos - 2, shrink_factor, scale)
+
+        for ins in ([] if density_mode else getattr(gene, "insertions", [])):
             if hasattr(ins, 'position'):
                 ins_pos = ins.position
                 ins_length = getattr(ins, 'length', 1)
@@ -732,18 +1140,9 @@ def draw_region_gene_structures(
             x = LEFT_MARGIN + (ins_pos - draw_start) / shrink_factor * scale
             base_width = get_insertion_base_width(ins_length, shrink_factor, scale)
 
-            dwg.add(
-                dwg.polygon(
-                    points=[
-                        (x - base_width / 2, y_triangle),
-                        (x + base_width / 2, y_triangle),
-                        (x, y_triangle + triangle_height)
-                    ],
-                    fill=ins_color,
-                    stroke=ins_color,
-                    stroke_width=1.5
-                )
-            )
+            paint = styles.attrs('insertion', fill=ins_color, stroke=ins_color, stroke_width=1.5)
+            add_glyph(dwg, symbols, ('insertion', base_width, ins_color), x, y_triangle,
+                      lambda x, y: insertion_triangle(dwg, x, y, base_width / 2, triangle_height, paint))
 
         # === SNPs ===
         snp_extend_up = 8
@@ -751,7 +1150,7 @@ def draw_region_gene_structures(
         y_snp_top = y_pos - snp_extend_up
         y_snp_bottom = y_pos + height_feature + snp_extend_down
 
-        for snp in getattr(gene, "snps", []):
+        for snp in ([] if density_mode else getattr(gene, "snps", [])):
             if hasattr(snp, "position"):
                 snp_pos = snp.position
             else:
@@ -759,14 +1158,9 @@ def draw_region_gene_structures(
 
             snp_color = FEATURE_COLORS.get('snp', 'black')
             x = LEFT_MARGIN + (snp_pos - draw_start) / shrink_factor * scale
-            dwg.add(
-                dwg.line(
-                    start=(x, y_snp_top),
-                    end=(x, y_snp_bottom),
-                    stroke=snp_color,
-                    stroke_width=1.2
-                )
-            )
+            paint = styles.attrs('snp', stroke=snp_color, stroke_width=1.2)
+            add_glyph(dwg, symbols, ('snp', y_snp_bottom - y_snp_top, snp_color), x, y_snp_top,
+                      lambda x, y: snp_tick(dwg, x, y, y_snp_bottom - y_snp_top, paint))
 
         # ドメインを描画（上層）
         for feat in all_features:
@@ -776,11 +1170,11 @@ def draw_region_gene_structures(
                 domain_color = feat.attributes.get('color', FEATURE_COLORS.get('domain', 'green'))
                 if domain_gradation == "on":
                     domain_color = f'url(#{get_or_create_gradient(dwg, domain_color, grad_dict)})'
-                dwg.add(dwg.rect(insert=(x_start, y_pos), size=(x_end - x_start, height_feature), fill=domain_color, stroke='black', stroke_width=1))
+                dwg.add(dwg.rect(insert=(x_start, y_pos), size=(x_end - x_start, height_feature), **styles.attrs('domain', fill=domain_color, stroke='black', stroke_width=1)))
 
         # ラベルを遺伝子構造の下に描画（中央揃え）
         if show_labels and gene_center_x is not None:
-            dwg.add(dwg.text(label, insert=(gene_center_x, y_pos + height_feature + label_spacing + 10), font_size='10px', fill='black', font_family='monospace', text_anchor='middle'))
+            dwg.add(dwg.text(label, insert=(gene_center_x, y_pos + height_feature + label_spacing + 10), **styles.attrs('gene_label', font_size='10px', fill='black', font_family='monospace', text_anchor='middle')))
 
     # === 凡例の動的生成 ===
     legend_x = LEFT_MARGIN + axis_width + 50
@@ -788,13 +1182,13 @@ def draw_region_gene_structures(
     box_size, spacing = 12, 20
     present_feature_types = set()
     for gene in genes:
-        for f in gene.get_sorted_features(): present_feature_types.add(f.feature_type)
+        present_feature_types.update(f.feature_type for f in gene.features)
     
     legend_items = []
     if 'CDS' in present_feature_types or 'exon' in present_feature_types: legend_items.append(('CDS', 'Exon/CDS'))
     if 'five_prime_UTR' in present_feature_types: legend_items.append(('five_prime_UTR', "5' UTR"))
     if 'three_prime_UTR' in present_feature_types: legend_items.append(('three_prime_UTR', "3' UTR"))
-    if 'intron' in present_feature_types or any(get_baseline_segments(g['start'], g['end'], [f for f in g['gene'].features if f.feature_type == 'deletion']) for g in gene_ranges):
+    if 'intron' in present_feature_types or any(get_baseline_segments(g['start'], g['end'], g['gene'].get_features_by_type('deletion')) for g in gene_ranges):
         legend_items.append(('intron', 'Intron'))
     if 'deletion' in present_feature_types: legend_items.append(('deletion', 'Deletion'))
     if any(getattr(g['gene'], "insertions", []) for g in gene_ranges): legend_items.append(('insertion', 'Insertion'))
@@ -811,25 +1205,33 @@ def draw_region_gene_structures(
             y_mid = y_legend + box_size // 2
             del_color = FEATURE_COLORS.get('deletion', 'black')
             if del_color == 'none': del_color = 'black'
-            dwg.add(dwg.polyline(points=[(legend_x, y_mid), (legend_x + box_size // 2, y_mid - 6), (legend_x + box_size, y_mid)], fill="none", stroke=del_color, stroke_width=1.5, stroke_dasharray="2,2"))
+            paint = styles.attrs('legend_deletion', fill="none", stroke=del_color, stroke_width=1.5, stroke_dasharray="2,2")
+            add_glyph(dwg, symbols, ('legend_deletion', del_color), legend_x, y_mid,
+                      lambda x, y: deletion_chevron(dwg, x, y, box_size, 6, paint))
         elif feat_key == 'insertion':
             y_mid = y_legend + box_size // 2
-            x0 = legend_x
-            x1 = legend_x + box_size // 2
-            x2 = legend_x + box_size
             ins_color = FEATURE_COLORS.get('insertion', 'black')
-            dwg.add(dwg.polygon(points=[(x0, y_mid - 4), (x2, y_mid - 4), (x1, y_mid + 4)], fill=ins_color, stroke=ins_color, stroke_width=1.5))
+            paint = styles.attrs('insertion', fill=ins_color, stroke=ins_color, stroke_width=1.5)
+            add_glyph(dwg, symbols, ('legend_insertion', ins_color), legend_x + box_size // 2, y_mid - 4,
+                      lambda x, y: insertion_triangle(dwg, x, y, box_size // 2, 8, paint))
         elif feat_key == 'snp':
             snp_color = FEATURE_COLORS.get('snp', 'black')
-            dwg.add(dwg.line(start=(legend_x + box_size // 2, y_legend), end=(legend_x + box_size // 2, y_legend + box_size), stroke=snp_color, stroke_width=1.2))
+            paint = styles.attrs('snp', stroke=snp_color, stroke_width=1.2)
+            add_glyph(dwg, symbols, ('snp', box_size, snp_color), legend_x + box_size // 2, y_legend,
+                      lambda x, y: snp_tick(dwg, x, y, box_size, paint))
         elif feat_key == 'intron':
             y_line = y_legend + box_size // 2
-            dwg.add(dwg.line(start=(legend_x, y_line), end=(legend_x + box_size, y_line), stroke=FEATURE_COLORS.get('intron', 'black'), stroke_width=1))
+            dwg.add(dwg.line(start=(legend_x, y_line), end=(legend_x + box_size, y_line), **styles.attrs('legend_intron', stroke=FEATURE_COLORS.get('intron', 'black'), stroke_width=1)))
         else:
             base_color = FEATURE_COLORS.get(feat_key, 'gray')
             if feat_key == 'domain': base_color = all_domain_colors.get(label_text, base_color)
             fill_color = base_color
-            dwg.add(dwg.rect(insert=(legend_x, y_legend), size=(box_size, box_size), fill=fill_color, stroke='black'))
-        dwg.add(dwg.text(label_text, insert=(legend_x + box_size + 5, y_legend + box_size - 2), font_size='12px', fill='black'))
-
+            paint = styles.attrs(feat_key, fill=fill_color, stroke='black')
+            add_glyph(dwg, symbols, ('swatch', fill_color), legend_x, y_legend,
+                      lambda x, y: legend_swatch(dwg, x, y, box_size, paint))
+        dwg.add(dwg.text(label_text, insert=(legend_x + box_size + 5, y_legend + box_size - 2), **styles.attrs('legend_label', font_size='12px', fill='black')))
+
+    if paths is not None:
+        paths.flush(dwg, structure_layer)
+    styles.write_to(dwg)
     dwg.save()
@@ -2,7 +2,7 @@ import csv
 import argparse
 import os
 from parse_utils import (
-    parse_gff_for_transcript,
+    parse_gff_for_transcripts,
     parse_gff_for_region,
     parse_deletions,
     parse_insertions,
@@ -10,6 +10,11 @@ from parse_utils import (
     parse_domains,
     print_features_as_gff
 )
+from bgzf_utils import open_text
+from gff_index import ensure_transcript_index
+from sqlite_store import ensure_sqlite_store
+from vcf_utils import load_vcf_variants
+from domain_utils import load_domain_hits, load_protein_map
 from draw_utils import draw_gene_structure, draw_region_gene_structures
 from welcome_message import print_welcome_message
 
@@ -23,14 +28,14 @@ def parse_args():
         "--gff", "--gtf",
         dest="gff_file",
         required=True,
-        help="Path to GFF or GTF file"
+        help="Path to GFF or GTF file (plain, gzip or bgzip)"
     )
 
     parser.add_argument(
         "--input", "-i",
         dest="input_csv",
         default=None,
-        help="Input CSV file describing gene features (transcript mode)"
+        help="Input CSV file describing gene features (transcript mode, plain or gzip)"
     )
 
     parser.add_argument(
@@ -70,6 +75,55 @@ def parse_args():
         help="Coordinate mode: relative or absolute. If not specified, the coordinate axis is not drawn."
     )
 
+    parser.add_argument(
+        "--no-index",
+        dest="use_index",
+        action="store_false",
+        help="Do not build or use the transcript ID index (<gff>.gsidx) or the region index (<gff>.gsreg / <gff>.tbi)"
+    )
+
+    parser.add_argument(
+        "--snapshot",
+        dest="use_snapshot",
+        action="store_true",
+        help="Load the annotation from a memory-mapped snapshot (<gff>.gssnap), created on the first run (requires numpy)"
+    )
+
+    parser.add_argument(
+        "--vcf",
+        dest="vcf_file",
+        default=None,
+        help="VCF file (plain or bgzip) whose SNPs, insertions and deletions are added to every transcript drawn in transcript mode"
+    )
+
+    parser.add_argument(
+        "--domains-tsv",
+        dest="domains_tsv",
+        default=None,
+        help="InterProScan TSV or hmmscan --domtblout file with protein domain hits (transcript mode). Without --input, every transcript with hits is drawn"
+    )
+
+    parser.add_argument(
+        "--protein-map",
+        dest="protein_map",
+        default=None,
+        help="Two-column file mapping protein IDs in --domains-tsv to transcript IDs (default: protein ID = transcript ID)"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes for full-file GFF scans (index building, unindexed region mode; uncompressed files only)"
+    )
+
+    parser.add_argument(
+        "--sqlite",
+        dest="sqlite_db",
+        default=None,
+        help="Query the annotation from a SQLite database, imported from --gff on the first run (can be shared between processes)"
+    )
+
     args = parser.parse_args()
     validate_args(parser, args)
     return args
@@ -81,9 +135,12 @@ def validate_args(parser, args):
     has_region = any(region_args)
     has_input = args.input_csv is not None
 
+    # --domains-tsv だけでもトランスクリプトモードとして動く
+    has_input = has_input or args.domains_tsv is not None
+
     # Both modes specified
     if has_region and has_input:
-        parser.error("Cannot use --input with region mode (--chr, --start, --end)")
+        parser.error("Cannot use --input or --domains-tsv with region mode (--chr, --start, --end)")
 
     # Region mode requires all three arguments
     if has_region and not all(region_args):
@@ -91,7 +148,13 @@ def validate_args(parser, args):
 
     # Neither mode specified
     if not has_region and not has_input:
-        parser.error("Either --input or region mode (--chr, --start, --end) is required")
+        parser.error("Either --input, --domains-tsv or region mode (--chr, --start, --end) is required")
+
+    if args.protein_map and not args.domains_tsv:
+        parser.error("--protein-map requires --domains-tsv")
+
+    if args.vcf_file and has_region:
+        parser.error("--vcf can only be used in transcript mode (--input)")
 
 
 def main():
@@ -105,9 +168,20 @@ def main():
     # Ensure output directory exists
     os.makedirs(output_prefix, exist_ok=True)
 
+    # SQLite ストアを使う場合は、以降の検索をすべてデータベースに対して行う
+    if args.sqlite_db:
+        ensure_sqlite_store(gff_file, args.sqlite_db)
+        gff_file = args.sqlite_db
+
     # Region mode (領域指定モード)
     if args.chromosome and args.start and args.end:
-        genes = parse_gff_for_region(gff_file, args.chromosome, args.start, args.end)
+        genes = parse_gff_for_region(
+            gff_file, args.chromosome, args.start, args.end,
+            use_index=args.use_index,
+            use_snapshot=args.use_snapshot,
+            workers=args.workers,
+            normalize=True
+        )
 
         if not genes:
             print(f"No transcripts found in region {args.chromosome}:{args.start}-{args.end}")
@@ -115,9 +189,6 @@ def main():
 
         labels = [g.gene_id for g in genes]
 
-        for gene in genes:
-            gene.normalize_features()
-
         output_svg = f"{output_prefix}/{args.chromosome}_{args.start}-{args.end}.svg"
 
         draw_region_gene_structures(
@@ -134,56 +205,104 @@ def main():
     # Transcript mode (トランスクリプト指定モード / CSV入力)
     else:
         input_csv = args.input_csv
-        with open(input_csv, newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                transcript_id = row["transcript_id"]
-
-                snps_raw = row.get("snp", "").replace(";", "_")
-                snps = f"_SNP_{snps_raw}" if snps_raw else ""
 
-                deletions_raw = row.get("deletions", "").replace(";", "_")
-                deletions = f"_DEL_{deletions_raw}" if deletions_raw else ""
-
-                insertions_raw = row.get("insertions", "").replace(";", "_")
-                insertions = f"_INS_{insertions_raw}" if insertions_raw else ""
-
-                domains_raw = row.get("domains", "").replace(":", "_").replace(";", "_")
-                domains = f"_DOM_{domains_raw}" if domains_raw else ""
-
-                snp_positions = parse_snps(row.get("snp", ""))
-                deletion_regions_relative = parse_deletions(row.get("deletions", ""))
-                insertion_positions = parse_insertions(row.get("insertions", ""))
-                domain_defs = parse_domains(row.get("domains", ""))
-
-                gene = parse_gff_for_transcript(gff_file, transcript_id)
-                if not gene:
-                    print(f"Skip: {transcript_id} not found")
-                    continue
-
-                gene.normalize_features()
-
-                # 相対座標に変換（変異を適用する前に行う）
-                # absolute モードの場合でも、内部的には相対座標で扱い、描画時に anchor を使って絶対座標に戻す
-                gene.to_relative()
-
-                # domain（AA座標 → ゲノム座標）
-                for start_aa, end_aa, name in domain_defs:
-                    gene.add_domain_from_protein_coords(start_aa, end_aa, name)
-
-                # variants (相対座標ベースで適用)
-                gene.update_features_with_deletions(deletion_regions_relative)
-                gene.add_insertions(insertion_positions)
-                gene.add_snps(snp_positions)
-
-                # 最終的な座標系が整った状態で描画
-                output_svg = f"{output_prefix}/{transcript_id}{snps}{deletions}{insertions}{domains}.svg"
+        # 初回のみ GFF を走査してインデックスを作成し、以降の検索は seek のみで行う
+        if args.use_index and not args.use_snapshot and not args.sqlite_db:
+            ensure_transcript_index(gff_file, workers=args.workers)
+
+        rows = None
+        if input_csv:
+            with open_text(input_csv, newline="") as f:
+                rows = list(csv.DictReader(f))
+
+        # ドメイン注釈ファイルは 1 回だけ読み、transcript ごとにまとめる
+        domain_hits = {}
+        if args.domains_tsv:
+            protein_map = load_protein_map(args.protein_map) if args.protein_map else None
+            domain_hits = load_domain_hits(
+                args.domains_tsv, protein_map,
+                transcript_ids=[row["transcript_id"] for row in rows] if rows is not None else None
+            )
+
+        # --input がなければ、ドメインのある transcript をすべて描画する
+        if rows is None:
+            rows = [{"transcript_id": transcript_id} for transcript_id in domain_hits]
+
+        # CSV 内の transcript をまとめて 1 回で読み込む（同じ transcript が複数行あっても 1 回だけ）
+        base_genes = parse_gff_for_transcripts(
+            gff_file, [row["transcript_id"] for row in rows],
+            use_index=args.use_index,
+            use_snapshot=args.use_snapshot
+        )
 
-                draw_gene_structure(
-                    gene, output_svg,
-                    coordinate_mode=args.coordinate_mode
-                )
-                print(f"Finished! : {output_svg}")
+        # 正規化・相対座標化は transcript ごとに 1 回だけ行い、各行はその複製に変異を適用する
+        genomic_extents = {}
+        for transcript_id, base_gene in base_genes.items():
+            base_gene.normalize_features()
+            start, end = base_gene.get_full_extent()
+            genomic_extents[transcript_id] = (base_gene.seqid, start, end)
+
+            # 相対座標に変換（変異を適用する前に行う）
+            # absolute モードの場合でも、内部的には相対座標で扱い、描画時に anchor を使って絶対座標に戻す
+            base_gene.to_relative()
+
+        # VCF の変異を相対座標に変換して transcript ごとに集める（VCF は 1 回だけ読む）
+        vcf_variants = {}
+        if args.vcf_file:
+            vcf_variants = load_vcf_variants(args.vcf_file, {
+                tid: (*genomic_extents[tid], gene.strand, gene.anchor)
+                for tid, gene in base_genes.items()
+            })
+
+        for row in rows:
+            transcript_id = row["transcript_id"]
+
+            snps_raw = row.get("snp", "").replace(";", "_")
+            snps = f"_SNP_{snps_raw}" if snps_raw else ""
+
+            deletions_raw = row.get("deletions", "").replace(";", "_")
+            deletions = f"_DEL_{deletions_raw}" if deletions_raw else ""
+
+            insertions_raw = row.get("insertions", "").replace(";", "_")
+            insertions = f"_INS_{insertions_raw}" if insertions_raw else ""
+
+            domains_raw = row.get("domains", "").replace(":", "_").replace(";", "_")
+            domains = f"_DOM_{domains_raw}" if domains_raw else ""
+
+            snp_positions = parse_snps(row.get("snp", ""))
+            deletion_regions_relative = parse_deletions(row.get("deletions", ""))
+            insertion_positions = parse_insertions(row.get("insertions", ""))
+            domain_defs = parse_domains(row.get("domains", "")) + domain_hits.get(transcript_id, [])
+
+            base_gene = base_genes.get(transcript_id)
+            if not base_gene:
+                print(f"Skip: {transcript_id} not found")
+                continue
+            gene = base_gene.clone()
+
+            # VCF 由来の変異を CSV の変異に加える
+            if transcript_id in vcf_variants:
+                found = vcf_variants[transcript_id]
+                deletion_regions_relative = deletion_regions_relative + found["deletions"]
+                insertion_positions = insertion_positions + found["insertions"]
+                snp_positions = snp_positions + found["snps"]
+
+            # domain（AA座標 → ゲノム座標）
+            gene.add_domains_from_protein_coords(domain_defs)
+
+            # variants (相対座標ベースで適用)
+            gene.update_features_with_deletions(deletion_regions_relative)
+            gene.add_insertions(insertion_positions)
+            gene.add_snps(snp_positions)
+
+            # 最終的な座標系が整った状態で描画
+            output_svg = f"{output_prefix}/{transcript_id}{snps}{deletions}{insertions}{domains}.svg"
+
+            draw_gene_structure(
+                gene, output_svg,
+                coordinate_mode=args.coordinate_mode
+            )
+            print(f"Finished! : {output_svg}")
 
 
 if __name__ == "__main__":
@@ -1,5 +1,9 @@
+import sys
+from bisect import bisect_right
 from enum import Enum
 from color_utils import get_domain_color
+from gff_attributes import parse_attributes
+from interval_utils import subtract_intervals
 from config import DOMAIN_COLOR_PALETTE
 
 
@@ -18,55 +22,151 @@ class CoordinateMode(str, Enum):
 # =====================
 
 class Insertion:
+    __slots__ = ('position', 'length')
+
     def __init__(self, position, length):
         self.position = position
         self.length = length
 
 class Snp:
+    __slots__ = ('position',)
+
     def __init__(self, position):
         self.position = position
 
 class Deletion:
+    __slots__ = ('start', 'end')
+
     def __init__(self, start, end):
         self.start = start
         self.end = end
 
 
+def _get_variant_store():
+    # numpy は任意依存のため、使えない場合は None を返して list で保持する
+    try:
+        from variant_store import VariantStore
+    except ImportError:
+        return None
+    return VariantStore
+
+
+def _is_variant_store(variants):
+    VariantStore = _get_variant_store()
+    return VariantStore is not None and isinstance(variants, VariantStore)
+
+
 # =====================
 # クラス定義
 # =====================
 
 class GeneFeature:
-    def __init__(self, seqid, start, end, feature_type, strand, attributes=None):
-        self.seqid = seqid
+    # 大量の feature を保持するため __dict__ を持たせない
+    __slots__ = ('seqid', 'start', 'end', 'feature_type', 'strand', 'raw_attributes', '_attributes')
+
+    def __init__(self, seqid, start, end, feature_type, strand, attributes=None, raw_attributes=None):
+        # 繰り返し現れる短い文字列は intern して feature 間で共有する
+        self.seqid = sys.intern(seqid)
         self.start = start
         self.end = end
-        self.feature_type = feature_type
-        self.strand = strand
-        self.attributes = attributes or {}
+        self.feature_type = sys.intern(feature_type)
+        self.strand = sys.intern(strand)
+        # GFF の属性列は文字列のまま保持し、参照されたときに初めて dict 化する
+        self.raw_attributes = raw_attributes
+        self._attributes = attributes
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = parse_attributes(self.raw_attributes) if self.raw_attributes else {}
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value):
+        self._attributes = value
 
 class GeneStructure:
     def __init__(self, gene_id, seqid, strand):
         self.gene_id = gene_id
         self.seqid = seqid
         self.strand = strand
-        self.features = []
+        self._features = []
+        self._views = {}  # 種類ごとのソート済みビュー（変更時に破棄）
         self.insertions = []
         self.snps = []
         self.deletion_regions = []
         self.domain_color_map = {}
         self.anchor = 0  # 基準となるゲノム座標を保存
 
+    def clone(self):
+        """
+        Return a cheap copy for deriving a variant model from a shared base.
+
+        Feature and variant objects are shared with the original rather than
+        copied; GeneStructure methods never modify them in place (they build
+        new lists / objects instead), so changes to the clone do not leak
+        back into the original.
+        """
+        other = GeneStructure(self.gene_id, self.seqid, self.strand)
+        other.features = list(self.features)
+        other.insertions = self.insertions.copy()
+        other.snps = self.snps.copy()
+        other.deletion_regions = list(self.deletion_regions)
+        other.domain_color_map = dict(self.domain_color_map)
+        other.anchor = self.anchor
+        return other
+
+    @property
+    def features(self):
+        """
+        Features in insertion order, as a read-only tuple. Replace them
+        (gene.features = [...]) or use add_feature() to change them, so that
+        the cached sorted views are invalidated.
+        """
+        # 内部のリストを直接書き換えられないよう、タプルを返す（変更されるまでキャッシュ）
+        view = self._views.get(None)
+        if view is None:
+            view = self._views[None] = tuple(self._features)
+        return view
+
+    @features.setter
+    def features(self, features):
+        self._features = list(features)
+        self._views = {}
+
     def add_feature(self, feature: GeneFeature):
-        self.features.append(feature)
+        self._features.append(feature)
+        self._views = {}
 
     def get_sorted_features(self):
-        return sorted(self.features, key=lambda f: f.start, reverse=False)
+        """start 順にソートした feature のリスト（キャッシュされるため変更しないこと）"""
+        return self.get_features_by_type()
+
+    def get_features_by_type(self, *feature_types):
+        """
+        Return the features of the given types (all features if none are
+        given), sorted by start. The result is cached until the features
+        change and must not be modified by the caller.
+        """
+        view = self._views.get(feature_types)
+        if view is None:
+            if feature_types:
+                view = [f for f in self.get_sorted_features() if f.feature_type in feature_types]
+            else:
+                view = sorted(self._features, key=lambda f: f.start)
+            self._views[feature_types] = view
+        return view
 
     def add_insertions(self, insertions):
         """
         List[Insertion] または List[int] または List[list] を受け取り、内部で Insertion オブジェクトとして保持
+        （numpy があれば VariantStore に配列としてまとめて保持）
         """
+        VariantStore = _get_variant_store()
+        if VariantStore is not None:
+            self.insertions = VariantStore.from_insertions(insertions)
+            return
+
         self.insertions = []
         for ins in insertions:
             if isinstance(ins, Insertion):
@@ -82,7 +182,13 @@ class GeneStructure:
     def add_snps(self, snps):
         """
         List[Snp] または List[int] または List[list] を受け取り保持
+        （numpy があれば VariantStore に配列としてまとめて保持）
         """
+        VariantStore = _get_variant_store()
+        if VariantStore is not None:
+            self.snps = VariantStore.from_snps(snps)
+            return
+
         self.snps = []
         for s in snps:
             if isinstance(s, Snp):
@@ -100,9 +206,9 @@ class GeneStructure:
         3. exon のみ → そのまま維持
         4. イントロンを追加
         """
-        exons = [f for f in self.features if f.feature_type == 'exon']
-        cds_list = [f for f in self.features if f.feature_type == 'CDS']
-        utrs = [f for f in self.features if f.feature_type in ('five_prime_UTR', 'three_prime_UTR')]
+        exons = self.get_features_by_type('exon')
+        cds_list = self.get_features_by_type('CDS')
+        utrs = self.get_features_by_type('five_prime_UTR', 'three_prime_UTR')
 
         # Case 1 & 2: CDS がある場合
         if cds_list:
@@ -133,18 +239,18 @@ class GeneStructure:
                 if exon.end > cds_end and exon.start <= cds_end + 1:
                     utr_start = max(exon.start, cds_end + 1)
                     if utr_start <= exon.end:
-                        self.features.append(GeneFeature(
+                        self.add_feature(GeneFeature(
                             self.seqid, utr_start, exon.end,
-                            'five_prime_UTR', self.strand, {}
+                            'five_prime_UTR', self.strand
                         ))
 
                 # 3' UTR: exon の開始から CDS の開始まで
                 if exon.start < cds_start and exon.end >= cds_start - 1:
                     utr_end = min(exon.end, cds_start - 1)
                     if exon.start <= utr_end:
-                        self.features.append(GeneFeature(
+                        self.add_feature(GeneFeature(
                             self.seqid, exon.start, utr_end,
-                            'three_prime_UTR', self.strand, {}
+                            'three_prime_UTR', self.strand
                         ))
             else:
                 # プラスストランド: 5' UTR は CDS より小さな座標、3' UTR は CDS より大きな座標
@@ -152,18 +258,18 @@ class GeneStructure:
                 if exon.start < cds_start and exon.end >= cds_start - 1:
                     utr_end = min(exon.end, cds_start - 1)
                     if exon.start <= utr_end:
-                        self.features.append(GeneFeature(
+                        self.add_feature(GeneFeature(
                             self.seqid, exon.start, utr_end,
-                            'five_prime_UTR', self.strand, {}
+                            'five_prime_UTR', self.strand
                         ))
 
                 # 3' UTR: CDS の終了から exon の終了まで
                 if exon.end > cds_end and exon.start <= cds_end + 1:
                     utr_start = max(exon.start, cds_end + 1)
                     if utr_start <= exon.end:
-                        self.features.append(GeneFeature(
+                        self.add_feature(GeneFeature(
                             self.seqid, utr_start, exon.end,
-                            'three_prime_UTR', self.strand, {}
+                            'three_prime_UTR', self.strand
                         ))
 
     def add_introns(self):
@@ -171,17 +277,14 @@ class GeneStructure:
         self.features = [f for f in self.features if f.feature_type != 'intron']
         
         # exon / CDS / UTR をまとめて処理
-        exon_like_list = sorted(
-            [f for f in self.features if f.feature_type in ('exon', 'CDS', 'five_prime_UTR', 'three_prime_UTR')],
-            key=lambda x: x.start
-        )
+        exon_like_list = self.get_features_by_type('exon', 'CDS', 'five_prime_UTR', 'three_prime_UTR')
 
         for i in range(len(exon_like_list) - 1):
             intron_start = exon_like_list[i].end + 1
             intron_end = exon_like_list[i + 1].start - 1
             if intron_start <= intron_end:
-                intron = GeneFeature(self.seqid, intron_start, intron_end, 'intron', self.strand, {})
-                self.features.append(intron)
+                intron = GeneFeature(self.seqid, intron_start, intron_end, 'intron', self.strand)
+                self.add_feature(intron)
 
     def add_domains(self, domain_regions):
         for domain in domain_regions:
@@ -211,23 +314,25 @@ class GeneStructure:
                 self.strand,
                 attributes={'name': name, 'color': color}
             )
-            self.features.append(domain_feature)
+            self.add_feature(domain_feature)
 
     def get_full_extent(self):
         """SNPや挿入を含めた、遺伝子構造の真の開始・終了座標を返す"""
         starts = [f.start for f in self.features]
         ends = [f.end for f in self.features]
 
-        for snp in self.snps:
-            pos = getattr(snp, 'position', snp)
-            starts.append(pos)
-            ends.append(pos)
-
-        for ins in self.insertions:
-            pos = getattr(ins, 'position', ins)
-            length = getattr(ins, 'length', 1)
-            starts.append(pos)
-            ends.append(pos + length - 1)
+        for variants in (self.snps, self.insertions):
+            if _is_variant_store(variants):
+                extent = variants.extent()
+                if extent:
+                    starts.append(extent[0])
+                    ends.append(extent[1])
+                continue
+            for v in variants:
+                pos = getattr(v, 'position', v)
+                length = getattr(v, 'length', 1)
+                starts.append(pos)
+                ends.append(pos + length - 1)
 
         if not starts:
             return 1, 1
@@ -253,68 +358,54 @@ class GeneStructure:
         for d in self.deletion_regions:
             new_features.append(GeneFeature(
                 self.seqid, d.start, d.end,
-                'deletion', self.strand, {}
+                'deletion', self.strand
             ))
 
-        for feature in self.features:
-            if feature.feature_type == 'deletion':
+        features = [f for f in self.features if f.feature_type != 'deletion']
+        deleted = [(d.start, d.end) for d in self.deletion_regions]
+        remaining = subtract_intervals([(f.start, f.end) for f in features], deleted)
+
+        for feature, segments in zip(features, remaining):
+            # デリーションと重ならない feature はそのまま使う
+            if len(segments) == 1 and segments[0] == (feature.start, feature.end):
+                new_features.append(feature)
                 continue
 
             # 非構造的要素（ドメイン等）の場合、デリーションと重なれば削除する
             if feature.feature_type not in structural_types:
-                overlaps = False
-                for d in self.deletion_regions:
-                    if not (feature.end < d.start or feature.start > d.end):
-                        overlaps = True
-                        break
-                if overlaps:
-                    continue
-
-            f_start, f_end = feature.start, feature.end
-            segments = [(f_start, f_end)]  # featureの元の範囲
+                continue
 
-            for d in self.deletion_regions:
-                del_start, del_end = d.start, d.end
-                updated_segments = []
-
-                for seg_start, seg_end in segments:
-                    # 削除領域と重なっていなければそのまま残す
-                    if seg_end < del_start or seg_start > del_end:
-                        updated_segments.append((seg_start, seg_end))
-                    else:
-                        # 左端が削除領域より前
-                        if seg_start < del_start:
-                            updated_segments.append((seg_start, del_start - 1))
-                        # 右端が削除領域より後
-                        if seg_end > del_end:
-                            updated_segments.append((del_end + 1, seg_end))
-                segments = updated_segments
-
-            # 分割後の有効セグメントが残っていれば追加
+            # 分割後の有効セグメントを追加
             for start, end in segments:
-                if start <= end:
-                    new_features.append(GeneFeature(
-                        seqid=feature.seqid,
-                        start=start,
-                        end=end,
-                        feature_type=feature.feature_type,
-                        strand=feature.strand,
-                        attributes=feature.attributes
-                    ))
+                new_features.append(GeneFeature(
+                    seqid=feature.seqid,
+                    start=start,
+                    end=end,
+                    feature_type=feature.feature_type,
+                    strand=feature.strand,
+                    attributes=feature._attributes,
+                    raw_attributes=feature.raw_attributes
+                ))
 
         # 結果を更新
         self.features = new_features
 
         # SNPと挿入のフィルタリング
         if self.deletion_regions:
-            self.snps = [
-                s for s in self.snps 
-                if not any(d.start <= s.position <= d.end for d in self.deletion_regions)
-            ]
-            self.insertions = [
-                i for i in self.insertions 
-                if not any(d.start <= i.position <= d.end for d in self.deletion_regions)
-            ]
+            if _is_variant_store(self.snps):
+                self.snps.remove_deleted(self.deletion_regions)
+            else:
+                self.snps = [
+                    s for s in self.snps
+                    if not any(d.start <= s.position <= d.end for d in self.deletion_regions)
+                ]
+            if _is_variant_store(self.insertions):
+                self.insertions.remove_deleted(self.deletion_regions)
+            else:
+                self.insertions = [
+                    i for i in self.insertions
+                    if not any(d.start <= i.position <= d.end for d in self.deletion_regions)
+                ]
 
     def to_relative(self):
         # 基準（1番）を決定するためのフィーチャーを選択
@@ -345,43 +436,51 @@ class GeneStructure:
             self.anchor = min(all_coords)
 
         # すべてのフィーチャーを変換
+        # clone() 元と feature を共有している可能性があるため、書き換えずに新しく作る
+        new_features = []
         for f in self.features:
             if self.strand == '-':
                 s = self.anchor - f.start + 1
                 e = self.anchor - f.end + 1
-                f.start = min(s, e)
-                f.end = max(s, e)
+                start, end = min(s, e), max(s, e)
             else:
-                f.start = f.start - self.anchor + 1
-                f.end = f.end - self.anchor + 1
+                start, end = f.start - self.anchor + 1, f.end - self.anchor + 1
+            new_features.append(GeneFeature(
+                f.seqid, start, end, f.feature_type, f.strand,
+                attributes=f._attributes, raw_attributes=f.raw_attributes
+            ))
+        self.features = new_features
 
         # SNPと挿入も変換
-        if hasattr(self, 'snps') and self.snps:
-            for s in self.snps:
-                pos = s.position
-                if self.strand == '-':
-                    s.position = self.anchor - pos + 1
-                else:
-                    s.position = pos - self.anchor + 1
-        
-        if hasattr(self, 'insertions') and self.insertions:
-            for ins in self.insertions:
-                pos = ins.position
-                if self.strand == '-':
-                    ins.position = self.anchor - pos + 1
-                else:
-                    ins.position = pos - self.anchor + 1
+        if _is_variant_store(self.snps):
+            self.snps.to_relative(self.anchor, self.strand)
+        elif hasattr(self, 'snps') and self.snps:
+            self.snps = [
+                Snp(self.anchor - s.position + 1 if self.strand == '-' else s.position - self.anchor + 1)
+                for s in self.snps
+            ]
+
+        if _is_variant_store(self.insertions):
+            self.insertions.to_relative(self.anchor, self.strand)
+        elif hasattr(self, 'insertions') and self.insertions:
+            self.insertions = [
+                Insertion(self.anchor - ins.position + 1 if self.strand == '-' else ins.position - self.anchor + 1,
+                          ins.length)
+                for ins in self.insertions
+            ]
 
         # デリーション領域も変換
         if hasattr(self, 'deletion_regions') and self.deletion_regions:
+            new_regions = []
             for d in self.deletion_regions:
                 s_orig, e_orig = d.start, d.end
                 if self.strand == '-':
                     s = self.anchor - s_orig + 1
                     e = self.anchor - e_orig + 1
-                    d.start, d.end = min(s, e), max(s, e)
+                    new_regions.append(Deletion(min(s, e), max(s, e)))
                 else:
-                    d.start, d.end = s_orig - self.anchor + 1, e_orig - self.anchor + 1
+                    new_regions.append(Deletion(s_orig - self.anchor + 1, e_orig - self.anchor + 1))
+            self.deletion_regions = new_regions
 
         return 1
 
@@ -390,55 +489,101 @@ class GeneStructure:
         アミノ酸座標（1-based）を基に、CDSからcDNA、そして現在の座標系へと変換して
         ドメイン領域をfeaturesに追加する。
         """
+        self.add_domains_from_protein_coords([(start_aa, end_aa, domain_name)])
 
-        # アミノ酸座標 → cDNA 座標（1-based）
-        cdna_start = (start_aa - 1) * 3 + 1
-        cdna_end = end_aa * 3
-
-        # CDS features を取得
-        cds_features = [f for f in self.features if f.feature_type == 'CDS']
-        if not cds_features:
-            return
-
-        # すでに to_relative() が実行されている場合、
-        # プラス・マイナスに関わらず start が小さい順に並べれば 5' -> 3' になる
-        cds_sorted = sorted(cds_features, key=lambda f: f.start)
+    def add_domains_from_protein_coords(self, domains):
+        """
+        Add many protein-coordinate domains at once.
 
-        current_cdna_pos = 1
+        The CDS map is built once and shared by all domains, so the cost per
+        domain is a binary search plus the number of CDS segments it spans.
 
-        for cds in cds_sorted:
-            cds_len = cds.end - cds.start + 1
-            next_cdna_pos = current_cdna_pos + cds_len - 1
+        Args:
+            domains: Iterable of (start_aa, end_aa, domain_name), 1-based
+        """
+        cds_map = CdsMap(self.get_features_by_type('CDS'))
+        if not cds_map:
+            return
 
-            # このCDSにドメインが含まれているか？
-            if next_cdna_pos < cdna_start:
-                current_cdna_pos = next_cdna_pos + 1
+        for start_aa, end_aa, domain_name in domains:
+            segments = cds_map.map_protein_range(start_aa, end_aa)
+            if not segments:
                 continue
-            if current_cdna_pos > cdna_end:
-                break
-
-            # オーバーラップする部分だけを計算
-            overlap_start = max(cdna_start, current_cdna_pos)
-            overlap_end = min(cdna_end, next_cdna_pos)
-            offset_start = overlap_start - current_cdna_pos
-            offset_end = overlap_end - current_cdna_pos
 
-            # 現在の座標（相対座標化されていれば相対座標）で位置を決定
-            # 5'末端が常に start になっているため、プラス鎖と同じ計算式でOK
-            g_start = cds.start + offset_start
-            g_end = cds.start + offset_end
-
-            # ドメイン feature を追加
             color = get_domain_color(domain_name, self.domain_color_map, DOMAIN_COLOR_PALETTE)
+            for g_start, g_end in segments:
+                self.add_feature(GeneFeature(
+                    seqid=self.seqid,
+                    start=g_start,
+                    end=g_end,
+                    feature_type='domain',
+                    strand=self.strand,
+                    attributes={'name': domain_name, 'color': color}
+                ))
+
+
+def normalize_gene_structures(genes):
+    """
+    Run normalize_features() on many transcripts at once.
+
+    Uses the vectorized bulk normalizer when numpy is available and falls
+    back to the per-object method otherwise; both give the same result.
+    """
+    try:
+        from bulk_normalize import normalize_bulk
+    except ImportError:
+        for gene in genes:
+            gene.normalize_features()
+        return
+    normalize_bulk(genes)
+
+
+class CdsMap:
+    """
+    Cumulative cDNA positions of the CDS segments of a transcript.
+
+    Maps cDNA / protein coordinates to the current coordinate frame with a
+    binary search. After to_relative() the 5' end is always the smallest
+    start, so CDS segments are ordered by start for both strands.
+
+    Args:
+        cds_features: CDS features sorted by start, e.g. the cached view
+                      from GeneStructure.get_features_by_type('CDS')
+    """
+
+    __slots__ = ('cds_starts', 'cdna_starts', 'cdna_ends')
+
+    def __init__(self, cds_features):
+        self.cds_starts = []
+        self.cdna_starts = []  # 各 CDS の先頭に対応する cDNA 座標 (1-based)
+        self.cdna_ends = []
 
-            domain_feature = GeneFeature(
-                seqid=self.seqid,
-                start=g_start,
-                end=g_end,
-                feature_type='domain',
-                strand=self.strand,
-                attributes={'name': domain_name, 'color': color}
-            )
-            self.features.append(domain_feature)
+        current_cdna_pos = 1
+        for cds in cds_features:
+            cds_len = cds.end - cds.start + 1
+            self.cds_starts.append(cds.start)
+            self.cdna_starts.append(current_cdna_pos)
+            self.cdna_ends.append(current_cdna_pos + cds_len - 1)
+            current_cdna_pos += cds_len
+
+    def __len__(self):
+        return len(self.cds_starts)
 
-            current_cdna_pos = next_cdna_pos + 1
+    def map_cdna_range(self, cdna_start, cdna_end):
+        """
+        cDNA 範囲を現在の座標系での (start, end) のリストに変換する（CDS ごとに分割）
+        """
+        segments = []
+        i = max(bisect_right(self.cdna_starts, cdna_start) - 1, 0)
+        while i < len(self.cdna_starts) and self.cdna_starts[i] <= cdna_end:
+            if self.cdna_ends[i] >= cdna_start:
+                # オーバーラップする部分だけを計算
+                offset_start = max(cdna_start, self.cdna_starts[i]) - self.cdna_starts[i]
+                offset_end = min(cdna_end, self.cdna_ends[i]) - self.cdna_starts[i]
+                segments.append((self.cds_starts[i] + offset_start, self.cds_starts[i] + offset_end))
+            i += 1
+        return segments
+
+    def map_protein_range(self, start_aa, end_aa):
+        """アミノ酸座標（1-based）の範囲を変換する"""
+        return self.map_cdna_range((start_aa - 1) * 3 + 1, end_aa * 3)
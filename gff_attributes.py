@@ -0,0 +1,183 @@
+import os
+from bgzf_utils import open_text
+
+# =====================
+# GFF / GTF 属性パーサ
+# =====================
+
+# GTF (Ensembl / GENCODE) の feature type を GFF3 の表記に揃える
+FEATURE_TYPE_ALIASES = {
+    'five_prime_utr': 'five_prime_UTR',
+    'three_prime_utr': 'three_prime_UTR',
+    '5UTR': 'five_prime_UTR',
+    '3UTR': 'three_prime_UTR',
+}
+
+# 5'/3' の区別がない UTR は読み飛ばし、exon と CDS の差分から計算し直す
+SKIPPED_FEATURE_TYPES = {'UTR'}
+
+# プロセス内キャッシュ: abspath -> ((size, mtime_ns), format)
+_FORMAT_CACHE = {}
+
+
+def parse_attributes(attr_string):
+    """
+    Parse GFF3 or GTF attribute string into a dictionary.
+
+    Args:
+        attr_string: Attribute string (e.g., "ID=mRNA1;Parent=gene1;Name=foo"
+                     or 'gene_id "g1"; transcript_id "t1";')
+
+    Returns:
+        dict: Attribute key-value pairs
+    """
+    attr_dict = {}
+    for item in attr_string.split(';'):
+        item = item.strip()
+        if '=' in item:
+            key, value = item.split('=', 1)
+            attr_dict[key] = value
+        elif ' ' in item:
+            key, value = item.split(' ', 1)
+            attr_dict[key] = value.strip().strip('"')
+    return attr_dict
+
+
+def get_attribute(attr_string, key):
+    """
+    Return the value of a single GFF3 attribute without building a dict.
+
+    The key only matches at the start of an attribute, so "ID" does not
+    match "GeneID=..." and values are compared as whole strings by callers.
+
+    Args:
+        attr_string: Raw attribute column
+        key: Attribute name (e.g., "ID")
+
+    Returns:
+        str or None
+    """
+    needle = key + '='
+    pos = attr_string.find(needle)
+    while pos >= 0:
+        if pos == 0 or attr_string[pos - 1] in '; \t':
+            value_start = pos + len(needle)
+            value_end = attr_string.find(';', value_start)
+            if value_end < 0:
+                value_end = len(attr_string)
+            return attr_string[value_start:value_end].rstrip()
+        pos = attr_string.find(needle, pos + 1)
+    return None
+
+
+def scan_id_parent(attr_string):
+    """
+    Extract only ID and Parent from a GFF3 attribute string.
+
+    Returns:
+        (feature_id, parents): feature_id is a str or None, parents is a
+        tuple of IDs (Parent may list several comma-separated values)
+    """
+    feature_id = get_attribute(attr_string, 'ID') or None
+    parent = get_attribute(attr_string, 'Parent')
+    parents = tuple(p for p in parent.split(',') if p) if parent else ()
+    return feature_id, parents
+
+
+def get_gtf_attribute(attr_string, key):
+    """GTF の属性 (key "value";) の値を dict を作らずに返す"""
+    needle = key + ' "'
+    pos = attr_string.find(needle)
+    while pos >= 0:
+        if pos == 0 or attr_string[pos - 1] in '; \t':
+            value_start = pos + len(needle)
+            value_end = attr_string.find('"', value_start)
+            if value_end < 0:
+                value_end = len(attr_string)
+            return attr_string[value_start:value_end]
+        pos = attr_string.find(needle, pos + 1)
+    return None
+
+
+def scan_gtf_ids(feature_type, attr_string):
+    """
+    GTF version of scan_id_parent.
+
+    GTF has no ID/Parent attributes; transcript lines are given the
+    transcript_id as their ID and all other transcript-level lines (exon,
+    CDS, UTR, ...) get it as their parent, so GTF plugs into the same
+    ID/Parent lookups as GFF3.
+
+    Returns:
+        (feature_id, parents)
+    """
+    if feature_type == 'gene':
+        return get_gtf_attribute(attr_string, 'gene_id') or None, ()
+
+    transcript_id = get_gtf_attribute(attr_string, 'transcript_id')
+    if not transcript_id:
+        return None, ()
+    if feature_type == 'transcript':
+        gene_id = get_gtf_attribute(attr_string, 'gene_id')
+        return transcript_id, (gene_id,) if gene_id else ()
+    return None, (transcript_id,)
+
+
+def _scan_gff3_ids(feature_type, attr_string):
+    return scan_id_parent(attr_string)
+
+
+def get_id_scanner(annotation_format):
+    """
+    Return a function (feature_type, attr_string) -> (feature_id, parents)
+    for the given format ('gff3' or 'gtf').
+    """
+    if annotation_format == 'gtf':
+        return scan_gtf_ids
+    return _scan_gff3_ids
+
+
+def normalize_feature_type(feature_type):
+    """feature type を GFF3 表記に揃える。読み飛ばす type の場合は None"""
+    if feature_type in SKIPPED_FEATURE_TYPES:
+        return None
+    return FEATURE_TYPE_ALIASES.get(feature_type, feature_type)
+
+
+def detect_annotation_format(path):
+    """
+    Detect whether an annotation file is GTF or GFF3 from the attribute
+    column of its first feature line (falls back to the file extension).
+
+    Returns:
+        str: 'gtf' or 'gff3'
+    """
+    abspath = os.path.abspath(path)
+    st = os.stat(path)
+    stat_key = (st.st_size, st.st_mtime_ns)
+    cached = _FORMAT_CACHE.get(abspath)
+    if cached and cached[0] == stat_key:
+        return cached[1]
+
+    annotation_format = None
+    with open_text(path) as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            parts = line.rstrip("\r\n").split("\t")
+            if len(parts) != 9:
+                continue
+            attrs = parts[8].strip()
+            first_item = attrs.split(';', 1)[0]
+            if '=' in first_item:
+                annotation_format = 'gff3'
+            elif ' "' in first_item:
+                annotation_format = 'gtf'
+            break
+
+    if annotation_format is None:
+        name = path[:-3] if path.endswith('.gz') else path
+        annotation_format = 'gtf' if name.endswith('.gtf') else 'gff3'
+
+    _FORMAT_CACHE[abspath] = (stat_key, annotation_format)
+    return annotation_format
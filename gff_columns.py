@@ -0,0 +1,402 @@
+import json
+import os
+import shutil
+import numpy as np
+from bgzf_utils import iter_lines
+from gff_index import get_file_signature
+from gene_classes import GeneFeature, GeneStructure
+from bulk_normalize import TYPE_CODES, OTHER, normalize_table, append_derived_features
+from gff_attributes import detect_annotation_format, get_id_scanner, normalize_feature_type
+
+# =====================
+# 列指向 (columnar) GFF ローダー
+# =====================
+
+TRANSCRIPT_TYPES = ('mRNA', 'transcript')
+
+STRAND_LABELS = ('+', '-', '.')
+STRAND_CODES = {'+': 0, '-': 1}
+
+
+def _encode(values, table):
+    """
+    文字列→出現順コードの辞書 table を、ソート順コードに振り直す。
+    Returns (sorted string array, remapped codes)
+    """
+    labels = np.array(list(table), dtype=str)
+    order = np.argsort(labels, kind='stable')
+    rank = np.empty(len(labels), dtype=np.int32)
+    rank[order] = np.arange(len(labels), dtype=np.int32)
+    codes = np.asarray(values, dtype=np.int32)
+    if len(labels):
+        codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1).astype(np.int32)
+    return labels[order], codes
+
+
+class GffColumns:
+    """
+    Struct-of-arrays view of the transcript features of a GFF.
+
+    One row per (feature line, owning transcript). A line whose Parent lists
+    several transcripts yields one row per transcript.
+
+    Row columns:
+        seqid:         int32 codes into seqids
+        start, end:    int64 (1-based, inclusive)
+        feature_type:  int16 codes into feature_types
+        strand:        int8 codes into STRAND_LABELS
+        transcript:    int32 codes into transcript_ids
+
+    String tables (seqids, feature_types, transcript_ids) are sorted numpy
+    string arrays, so IDs can be resolved with searchsorted.
+    """
+
+    ROW_COLUMNS = ('seqid', 'start', 'end', 'feature_type', 'strand', 'transcript')
+    TABLE_COLUMNS = ('seqids', 'feature_types', 'transcript_ids')
+
+    def __init__(self, seqid, start, end, feature_type, strand, transcript,
+                 seqids, feature_types, transcript_ids):
+        self.seqid = seqid
+        self.start = start
+        self.end = end
+        self.feature_type = feature_type
+        self.strand = strand
+        self.transcript = transcript
+        self.seqids = seqids
+        self.feature_types = feature_types
+        self.transcript_ids = transcript_ids
+        self._groups = None
+        self._extents = None
+        self._labels = {}
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def n_transcripts(self):
+        return len(self.transcript_ids)
+
+    def lookup(self, table, value):
+        """文字列テーブル中のコードを返す（なければ -1）"""
+        idx = int(np.searchsorted(table, value))
+        if idx < len(table) and table[idx] == value:
+            return idx
+        return -1
+
+    def labels(self, table_name):
+        """文字列テーブルを Python の list として返す（memmap の要素アクセスを避けるためキャッシュ）"""
+        labels = self._labels.get(table_name)
+        if labels is None:
+            labels = self._labels[table_name] = [str(v) for v in getattr(self, table_name)]
+        return labels
+
+    def transcript_code(self, transcript_id):
+        return self.lookup(self.transcript_ids, transcript_id)
+
+    def group_rows(self):
+        """
+        Group rows by transcript.
+
+        Returns:
+            (order, offsets): rows of transcript t are
+            order[offsets[t]:offsets[t + 1]], in file order
+        """
+        if self._groups is None:
+            order = np.argsort(self.transcript, kind='stable')
+            counts = np.bincount(self.transcript, minlength=self.n_transcripts)
+            offsets = np.zeros(self.n_transcripts + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            self._groups = (order, offsets)
+        return self._groups
+
+    def transcript_extents(self):
+        """
+        Per-transcript (seqid, start, end, strand, first_row) arrays, where
+        start/end span every row of the transcript and first_row is the
+        index of its first row (rows are in file order).
+        """
+        if self._extents is None:
+            order, offsets = self.group_rows()
+            # transcript 自身の行があるため、各グループは空にならない
+            first = offsets[:-1]
+            head = order[first] if len(order) else np.zeros(0, dtype=np.int64)
+            self._extents = (
+                self.seqid[head],
+                np.minimum.reduceat(self.start[order], first) if len(order) else np.zeros(0, dtype=np.int64),
+                np.maximum.reduceat(self.end[order], first) if len(order) else np.zeros(0, dtype=np.int64),
+                self.strand[head],
+                head.astype(np.int64),
+            )
+        return self._extents
+
+    def transcripts_in_region(self, seqid, region_start, region_end):
+        """
+        Transcript codes overlapping seqid:region_start-region_end, sorted by
+        transcript start. Transcripts with the same start keep the order in
+        which they first appear in the file, as in the text parser.
+        """
+        seq_code = self.lookup(self.seqids, seqid)
+        if seq_code < 0:
+            return np.zeros(0, dtype=np.int64)
+        tx_seqid, tx_start, tx_end, _, tx_first_row = self.transcript_extents()
+        mask = (tx_seqid == seq_code) & (tx_end >= region_start) & (tx_start <= region_end)
+        codes = np.flatnonzero(mask)
+        # transcript コードは ID の辞書順なので、同じ開始位置はファイル中の出現順で並べる
+        return codes[np.lexsort((tx_first_row[codes], tx_start[codes]))]
+
+    def to_gene_structure(self, code):
+        """1 transcript 分の GeneStructure を作る"""
+        order, offsets = self.group_rows()
+        rows = order[offsets[code]:offsets[code + 1]]
+        if not len(rows):
+            return None
+
+        seqids = self.labels('seqids')
+        feature_types = self.labels('feature_types')
+        first = rows[0]
+        gene = GeneStructure(
+            str(self.transcript_ids[code]),
+            seqids[self.seqid[first]],
+            STRAND_LABELS[self.strand[first]]
+        )
+        for seq_code, start, end, type_code, strand_code in zip(
+                self.seqid[rows].tolist(), self.start[rows].tolist(), self.end[rows].tolist(),
+                self.feature_type[rows].tolist(), self.strand[rows].tolist()):
+            gene.add_feature(GeneFeature(
+                seqids[seq_code], start, end,
+                feature_types[type_code], STRAND_LABELS[strand_code]
+            ))
+        return gene
+
+    def get_gene_structure(self, transcript_id):
+        """transcript ID から GeneStructure を作る（見つからなければ None）"""
+        code = self.transcript_code(transcript_id)
+        if code < 0:
+            return None
+        return self.to_gene_structure(code)
+
+    def to_gene_structures(self, codes):
+        return [self.to_gene_structure(int(c)) for c in codes]
+
+    def to_normalized_gene_structures(self, codes):
+        """
+        Build GeneStructures that are already normalized (same result as
+        to_gene_structures() followed by normalize_features()).
+
+        Normalization runs on the column arrays of all requested transcripts
+        at once, and feature objects are created only for the features that
+        remain (e.g. no objects for exons replaced by CDS/UTR).
+        """
+        order, offsets = self.group_rows()
+        codes = np.asarray(codes, dtype=np.int64)
+        counts = offsets[codes + 1] - offsets[codes]
+        # 要求された transcript の行を連結したテーブルを作る
+        group_starts = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=group_starts[1:])
+        gid = np.repeat(np.arange(len(codes), dtype=np.int64), counts)
+        pos = np.arange(group_starts[-1], dtype=np.int64) - group_starts[gid]
+        rows = order[offsets[codes][gid] + pos] if len(gid) else np.zeros(0, dtype=np.int64)
+
+        seqids = self.labels('seqids')
+        feature_types = self.labels('feature_types')
+        type_codes = np.array([TYPE_CODES.get(t, OTHER) for t in feature_types], dtype=np.int8)
+        first = rows[group_starts[:-1]] if len(rows) else np.zeros(0, dtype=np.int64)
+        minus = self.strand[first] == STRAND_CODES['-']
+        kept, utrs, introns = normalize_table(
+            gid, pos, self.start[rows], self.end[rows], type_codes[self.feature_type[rows]], minus
+        )
+
+        genes = [
+            GeneStructure(str(self.transcript_ids[code]), seqids[seq_code], STRAND_LABELS[strand_code])
+            for code, seq_code, strand_code in zip(
+                codes.tolist(), self.seqid[first].tolist(), self.strand[first].tolist())
+        ]
+        new_features = [[] for _ in genes]
+        kept_rows = rows[kept]
+        for g, seq_code, start, end, type_code, strand_code in zip(
+                gid[kept].tolist(), self.seqid[kept_rows].tolist(), self.start[kept_rows].tolist(),
+                self.end[kept_rows].tolist(), self.feature_type[kept_rows].tolist(),
+                self.strand[kept_rows].tolist()):
+            new_features[g].append(GeneFeature(
+                seqids[seq_code], start, end,
+                feature_types[type_code], STRAND_LABELS[strand_code]
+            ))
+        append_derived_features(genes, new_features, utrs, introns)
+
+        for gene, features in zip(genes, new_features):
+            gene.features = features
+        return genes
+
+    def parse_region(self, seqid, region_start, region_end, normalize=False):
+        """parse_gff_for_region と同じ結果を列データから返す"""
+        codes = self.transcripts_in_region(seqid, region_start, region_end)
+        if normalize:
+            return self.to_normalized_gene_structures(codes)
+        return self.to_gene_structures(codes)
+
+
+def load_gff_columns(gff_file):
+    """
+    Load the transcript features of a GFF into column arrays.
+
+    Lines are kept only if they are a transcript (mRNA/transcript) or are
+    a child of one; no per-line objects are created.
+
+    Args:
+        gff_file: Path to a plain or compressed GFF/GTF file
+
+    Returns:
+        GffColumns
+    """
+    scan_ids = get_id_scanner(detect_annotation_format(gff_file))
+    seqid_table, type_table = {}, {}
+    transcript_table = {}
+
+    line_seqid, line_start, line_end = [], [], []
+    line_type, line_strand = [], []
+    line_id, line_parents = [], []
+
+    for line in iter_lines(gff_file, desc="Loading GFF"):
+        if line.startswith("#") or not line.strip():
+            continue
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
+        seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+
+        feature_id, parents = scan_ids(feature_type, attributes)
+        if feature_type in TRANSCRIPT_TYPES and feature_id:
+            transcript_table.setdefault(feature_id, len(transcript_table))
+
+        feature_type = normalize_feature_type(feature_type)
+        if feature_type is None:
+            continue
+
+        line_seqid.append(seqid_table.setdefault(seqid, len(seqid_table)))
+        line_start.append(int(start))
+        line_end.append(int(end))
+        line_type.append(type_table.setdefault(feature_type, len(type_table)))
+        line_strand.append(STRAND_CODES.get(strand, 2))
+        line_id.append(feature_id)
+        line_parents.append(parents)
+
+    # 各行を所属 transcript ごとの行に展開（Parent 優先、なければ自身の ID）
+    row_line, row_transcript = [], []
+    for i, (feature_id, parents) in enumerate(zip(line_id, line_parents)):
+        owners = [transcript_table[p] for p in parents if p in transcript_table]
+        if not owners and feature_id in transcript_table:
+            owners = [transcript_table[feature_id]]
+        for owner in owners:
+            row_line.append(i)
+            row_transcript.append(owner)
+
+    row_line = np.asarray(row_line, dtype=np.int64)
+    seqids, seqid_codes = _encode(line_seqid, seqid_table)
+    feature_types, type_codes = _encode(line_type, type_table)
+    transcript_ids, transcript_codes = _encode(row_transcript, transcript_table)
+
+    return GffColumns(
+        seqid=seqid_codes[row_line] if len(row_line) else np.zeros(0, dtype=np.int32),
+        start=np.asarray(line_start, dtype=np.int64)[row_line],
+        end=np.asarray(line_end, dtype=np.int64)[row_line],
+        feature_type=(type_codes[row_line] if len(row_line) else np.zeros(0, dtype=np.int32)).astype(np.int16),
+        strand=np.asarray(line_strand, dtype=np.int8)[row_line],
+        transcript=transcript_codes,
+        seqids=seqids,
+        feature_types=feature_types,
+        transcript_ids=transcript_ids,
+    )
+
+
+# =====================
+# メモリマップ可能なスナップショット
+# =====================
+
+SNAPSHOT_SUFFIX = ".gssnap"
+SNAPSHOT_VERSION = 2
+
+_GROUP_COLUMNS = ('group_order', 'group_offsets')
+_EXTENT_COLUMNS = ('tx_seqid', 'tx_start', 'tx_end', 'tx_strand', 'tx_first_row')
+
+# プロセス内キャッシュ: abspath -> ((size, mtime_ns), GffColumns)
+_SNAPSHOT_CACHE = {}
+
+
+def get_snapshot_path(gff_file):
+    return gff_file + SNAPSHOT_SUFFIX
+
+
+def save_snapshot(columns, gff_file):
+    """
+    Write columns as a directory of .npy files next to the GFF.
+
+    Row columns, string tables, the per-transcript grouping and extents are
+    stored separately so that load_snapshot() can memory-map them without
+    any parsing. Returns False if the directory cannot be written.
+    """
+    snapshot_path = get_snapshot_path(gff_file)
+    tmp_path = snapshot_path + ".tmp"
+    arrays = {name: getattr(columns, name) for name in GffColumns.ROW_COLUMNS + GffColumns.TABLE_COLUMNS}
+    arrays.update(zip(_GROUP_COLUMNS, columns.group_rows()))
+    arrays.update(zip(_EXTENT_COLUMNS, columns.transcript_extents()))
+
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "signature": get_file_signature(gff_file)}, f)
+        shutil.rmtree(snapshot_path, ignore_errors=True)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+    return True
+
+
+def load_snapshot(gff_file):
+    """
+    Memory-map a snapshot written by save_snapshot().
+
+    Returns:
+        GffColumns, or None if there is no snapshot or it does not match
+        the current GFF
+    """
+    abspath = os.path.abspath(gff_file)
+    st = os.stat(gff_file)
+    stat_key = (st.st_size, st.st_mtime_ns)
+    cached = _SNAPSHOT_CACHE.get(abspath)
+    if cached and cached[0] == stat_key:
+        return cached[1]
+
+    snapshot_path = get_snapshot_path(gff_file)
+    try:
+        with open(os.path.join(snapshot_path, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != SNAPSHOT_VERSION or meta.get("signature") != get_file_signature(gff_file):
+        return None
+
+    def _load(name):
+        return np.load(os.path.join(snapshot_path, f"{name}.npy"), mmap_mode='r')
+
+    columns = GffColumns(**{name: _load(name) for name in GffColumns.ROW_COLUMNS + GffColumns.TABLE_COLUMNS})
+    columns._groups = tuple(_load(name) for name in _GROUP_COLUMNS)
+    columns._extents = tuple(_load(name) for name in _EXTENT_COLUMNS)
+    _SNAPSHOT_CACHE[abspath] = (stat_key, columns)
+    return columns
+
+
+def ensure_snapshot(gff_file):
+    """Load the snapshot, parsing the GFF and writing one first if needed."""
+    columns = load_snapshot(gff_file)
+    if columns is not None:
+        return columns
+
+    columns = load_gff_columns(gff_file)
+    save_snapshot(columns, gff_file)
+    st = os.stat(gff_file)
+    _SNAPSHOT_CACHE[os.path.abspath(gff_file)] = ((st.st_size, st.st_mtime_ns), columns)
+    return columns
@@ -0,0 +1,477 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from gff_attributes import detect_annotation_format, get_id_scanner
+from bgzf_utils import (
+    BgzfReader,
+    is_bgzf,
+    is_gzip,
+    read_tabix_linear_index,
+    split_line_ranges,
+    READ_BUFFER_SIZE
+)
+
+# =====================
+# トランスクリプトIDインデックス
+# =====================
+
+INDEX_SUFFIX = ".gsidx"
+INDEX_VERSION = 3
+
+# 署名用ハッシュは先頭・末尾のみを読む（巨大GFFを毎回全読みしないため）
+_HASH_CHUNK = 1 << 20
+
+# プロセス内キャッシュ: sidecar abspath -> ((size, mtime_ns), index)
+_INDEX_CACHE = {}
+
+
+def get_index_path(gff_file):
+    return gff_file + INDEX_SUFFIX
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def get_file_signature(path):
+    """
+    Return a signature used to validate sidecar indexes.
+
+    The signature combines file size, mtime and a SHA-1 of the first and
+    last megabyte, so a replaced or edited GFF invalidates the index
+    without hashing the whole file on every run.
+    """
+    size, mtime_ns = _stat_key(path)
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        sha1.update(f.read(_HASH_CHUNK))
+        if size > _HASH_CHUNK:
+            f.seek(max(size - _HASH_CHUNK, _HASH_CHUNK))
+            sha1.update(f.read())
+    return {"size": size, "mtime_ns": mtime_ns, "sha1": sha1.hexdigest()}
+
+
+def _line_keys(line, scan_ids):
+    """GFF3 / GTF 行から ID / Parent の値を返す"""
+    parts = line.rstrip("\r\n").split("\t")
+    if len(parts) != 9:
+        return ()
+    feature_id, parents = scan_ids(parts[2], parts[8])
+    if feature_id is None:
+        return parents
+    if feature_id in parents:
+        return parents
+    return (feature_id,) + parents
+
+
+def open_positional(gff_file):
+    """
+    Open a GFF for offset-based reading.
+
+    Returns a BgzfReader (virtual offsets) for bgzip-compressed files and a
+    plain binary file (byte offsets) otherwise; both support tell/seek/readline.
+    """
+    if is_bgzf(gff_file):
+        return BgzfReader(gff_file)
+    return open(gff_file, "rb")
+
+
+def is_seekable_annotation(gff_file):
+    """
+    Plain files and BGZF files can be read at recorded offsets; ordinary
+    gzip files can only be streamed.
+    """
+    return not is_gzip(gff_file) or is_bgzf(gff_file)
+
+
+def build_transcript_index(gff_file, workers=1):
+    """
+    Scan a GFF once and map every ID / Parent value to the byte ranges of
+    the lines that carry it (for GTF, transcript_id plays both roles; see
+    gff_attributes.scan_gtf_ids).
+
+    Args:
+        gff_file: Path to a plain or bgzip-compressed GFF/GTF file
+        workers: Number of processes; uncompressed files are split into
+                 line-aligned byte ranges that are indexed in parallel
+
+    Returns:
+        dict: {"signature": {...}, "ranges": {id: [offset, length, ...]}}
+              where offset is a byte offset (BGZF virtual offset for bgzip
+              files), length is in uncompressed bytes, and consecutive lines
+              of the same ID are merged into one range
+    """
+    compressed = is_bgzf(gff_file)
+    if workers > 1 and not compressed:
+        return _build_transcript_index_parallel(gff_file, workers)
+
+    scan_ids = get_id_scanner(detect_annotation_format(gff_file))
+    ranges = {}
+    last_end = {}  # id -> 直前に記録した行の終端（非圧縮位置）
+    position = 0  # 非圧縮での位置
+
+    with open_positional(gff_file) as f, tqdm(total=os.path.getsize(gff_file),
+                                              desc="Indexing GFF",
+                                              unit="B",
+                                              unit_scale=True,
+                                              bar_format="{l_bar}{bar}") as pbar:
+        while True:
+            offset = f.tell() if compressed else position
+            raw = f.readline()
+            if not raw:
+                break
+            length = len(raw)
+
+            if not raw.startswith(b"#") and raw.strip():
+                for key in _line_keys(raw.decode(), scan_ids):
+                    key_ranges = ranges.setdefault(key, [])
+                    # 直前の範囲と連続していれば結合する
+                    if last_end.get(key) == position:
+                        key_ranges[-1] += length
+                    else:
+                        key_ranges.extend((offset, length))
+                    last_end[key] = position + length
+            position += length
+            pbar.update((offset >> 16 if compressed else position) - pbar.n)
+
+        pbar.update(pbar.total - pbar.n)
+
+    return {
+        "version": INDEX_VERSION,
+        "signature": get_file_signature(gff_file),
+        "ranges": ranges,
+    }
+
+
+def _index_line_range(gff_file, begin, end, annotation_format):
+    """非圧縮ファイルの [begin, end) を索引する。(ranges, last_end) を返す"""
+    scan_ids = get_id_scanner(annotation_format)
+    ranges = {}
+    last_end = {}
+    position = begin
+
+    with open(gff_file, "rb", buffering=READ_BUFFER_SIZE) as f:
+        f.seek(begin)
+        while position < end:
+            raw = f.readline()
+            if not raw:
+                break
+            length = len(raw)
+            if not raw.startswith(b"#") and raw.strip():
+                for key in _line_keys(raw.decode(), scan_ids):
+                    key_ranges = ranges.setdefault(key, [])
+                    if last_end.get(key) == position:
+                        key_ranges[-1] += length
+                    else:
+                        key_ranges.extend((position, length))
+                    last_end[key] = position + length
+            position += length
+
+    return ranges, last_end
+
+
+def _build_transcript_index_parallel(gff_file, workers):
+    """
+    build_transcript_index() for uncompressed files using a process pool.
+    Per-range results are merged in file order (ranges that continue across
+    a chunk boundary are joined), so the index is identical to a serial build.
+    """
+    annotation_format = detect_annotation_format(gff_file)
+    chunks = split_line_ranges(gff_file, workers)
+    ranges = {}
+    last_end = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            tqdm(total=os.path.getsize(gff_file), desc="Indexing GFF", unit="B",
+                 unit_scale=True, bar_format="{l_bar}{bar}") as pbar:
+        futures = [
+            executor.submit(_index_line_range, gff_file, begin, end, annotation_format)
+            for begin, end in chunks
+        ]
+        for (begin, end), future in zip(chunks, futures):
+            chunk_ranges, chunk_last_end = future.result()
+            for key, key_ranges in chunk_ranges.items():
+                merged = ranges.get(key)
+                if merged is None:
+                    ranges[key] = key_ranges
+                elif last_end[key] == key_ranges[0]:
+                    merged[-1] += key_ranges[1]
+                    merged.extend(key_ranges[2:])
+                else:
+                    merged.extend(key_ranges)
+            last_end.update(chunk_last_end)
+            pbar.update(end - begin)
+
+    return {
+        "version": INDEX_VERSION,
+        "signature": get_file_signature(gff_file),
+        "ranges": ranges,
+    }
+
+
+def _save_sidecar(sidecar_path, index):
+    """インデックスを JSON で書き出す。書き込めない場合は False を返す"""
+    tmp_path = sidecar_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp_path, sidecar_path)
+    except OSError:
+        return False
+    return True
+
+
+def _load_sidecar(gff_file, sidecar_path, version):
+    """署名が一致する場合のみインデックスを返す（キャッシュ付き）"""
+    abspath = os.path.abspath(sidecar_path)
+    stat_key = _stat_key(gff_file)
+    cached = _INDEX_CACHE.get(abspath)
+    if cached and cached[0] == stat_key:
+        return cached[1]
+
+    if not os.path.exists(sidecar_path):
+        return None
+    try:
+        with open(sidecar_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != version:
+        return None
+    if index.get("signature") != get_file_signature(gff_file):
+        return None
+
+    _INDEX_CACHE[abspath] = (stat_key, index)
+    return index
+
+
+def _cache_sidecar(gff_file, sidecar_path, index):
+    _INDEX_CACHE[os.path.abspath(sidecar_path)] = (_stat_key(gff_file), index)
+
+
+def save_transcript_index(gff_file, index):
+    """Write the index next to the GFF. Returns False if the directory is read-only."""
+    return _save_sidecar(get_index_path(gff_file), index)
+
+
+def load_transcript_index(gff_file):
+    """
+    Return a valid transcript index for gff_file, or None if there is no
+    sidecar or it is stale.
+    """
+    return _load_sidecar(gff_file, get_index_path(gff_file), INDEX_VERSION)
+
+
+def ensure_transcript_index(gff_file, workers=1):
+    """
+    Load the sidecar index, building and saving it first if it is missing
+    or stale. If the sidecar cannot be written the index is still kept in
+    memory for the rest of the process. Returns None for non-seekable
+    (plain gzip) files.
+
+    workers is passed to build_transcript_index().
+    """
+    if not is_seekable_annotation(gff_file):
+        return None
+
+    index = load_transcript_index(gff_file)
+    if index is not None:
+        return index
+
+    index = build_transcript_index(gff_file, workers=workers)
+    save_transcript_index(gff_file, index)
+    _cache_sidecar(gff_file, get_index_path(gff_file), index)
+    return index
+
+
+def read_indexed_lines(gff_file, index, key):
+    """
+    Read only the lines recorded for key (ID or Parent value).
+
+    Returns:
+        List[str]: Matching GFF lines in file order (empty if key is unknown)
+    """
+    key_ranges = index["ranges"].get(key)
+    if not key_ranges:
+        return []
+
+    lines = []
+    with open_positional(gff_file) as f:
+        for i in range(0, len(key_ranges), 2):
+            f.seek(key_ranges[i])
+            chunk = f.read(key_ranges[i + 1]).decode()
+            lines.extend(chunk.splitlines())
+    return lines
+
+
+# =====================
+# 領域インデックス（座標ソート済み GFF / BGZF 用）
+# =====================
+
+REGION_INDEX_SUFFIX = ".gsreg"
+REGION_INDEX_VERSION = 3
+TABIX_SUFFIX = ".tbi"
+
+# tabix と同じ 16 kb ウィンドウ
+LINEAR_SHIFT = 14
+
+
+def get_region_index_path(gff_file):
+    return gff_file + REGION_INDEX_SUFFIX
+
+
+def build_region_index(gff_file):
+    """
+    Build a tabix-style linear index: for every seqid and every 16 kb
+    window, the offset of the first line overlapping that window.
+
+    The GFF must be grouped by seqid and sorted by start within each
+    seqid (e.g. sort -k1,1 -k4,4n, then bgzip). For unsorted files the
+    returned index has "sorted": False and region queries fall back to a
+    full scan.
+
+    Args:
+        gff_file: Path to a plain or bgzip-compressed GFF file
+
+    Returns:
+        dict: {"signature": {...}, "sorted": bool, "linear": {seqid: [offset, ...]}}
+    """
+    linear = {}
+    is_sorted = True
+    last_seqid = None
+    last_start = 0
+    compressed = is_bgzf(gff_file)
+
+    with open_positional(gff_file) as f, tqdm(total=os.path.getsize(gff_file),
+                                              desc="Indexing GFF regions",
+                                              unit="B",
+                                              unit_scale=True,
+                                              bar_format="{l_bar}{bar}") as pbar:
+        while True:
+            offset = f.tell()
+            raw = f.readline()
+            if not raw:
+                break
+            pbar.update((offset >> 16 if compressed else offset) - pbar.n)
+
+            if raw.startswith(b"#") or not raw.strip():
+                continue
+            parts = raw.split(b"\t", 5)
+            if len(parts) < 6:
+                continue
+            seqid = parts[0].decode()
+            start, end = int(parts[3]), int(parts[4])
+
+            if seqid != last_seqid:
+                if seqid in linear:
+                    is_sorted = False
+                    break
+                linear[seqid] = []
+                last_seqid = seqid
+                last_start = 0
+            elif start < last_start:
+                is_sorted = False
+                break
+            last_start = start
+
+            windows = linear[seqid]
+            first_window = (start - 1) >> LINEAR_SHIFT
+            last_window = (end - 1) >> LINEAR_SHIFT
+            if len(windows) <= last_window:
+                windows.extend([None] * (last_window + 1 - len(windows)))
+            for w in range(first_window, last_window + 1):
+                if windows[w] is None:
+                    windows[w] = offset
+
+        if is_sorted:
+            pbar.update(pbar.total - pbar.n)
+
+    if not is_sorted:
+        linear = {}
+
+    # 空ウィンドウは次に出現するオフセットで埋める
+    for windows in linear.values():
+        next_offset = None
+        for w in range(len(windows) - 1, -1, -1):
+            if windows[w] is None:
+                windows[w] = next_offset
+            else:
+                next_offset = windows[w]
+
+    return {
+        "version": REGION_INDEX_VERSION,
+        "signature": get_file_signature(gff_file),
+        "sorted": is_sorted,
+        "linear": linear,
+    }
+
+
+def load_region_index(gff_file):
+    """
+    Return a region index for gff_file: a tabix .tbi next to the file if
+    present (and not older than the GFF), otherwise a valid .gsreg sidecar.
+    Returns None if neither exists.
+    """
+    tbi_path = gff_file + TABIX_SUFFIX
+    if os.path.exists(tbi_path) and os.path.getmtime(tbi_path) >= os.path.getmtime(gff_file):
+        abspath = os.path.abspath(tbi_path)
+        cached = _INDEX_CACHE.get(abspath)
+        stat_key = _stat_key(gff_file)
+        if cached and cached[0] == stat_key:
+            return cached[1]
+        index = {"sorted": True, "linear": read_tabix_linear_index(tbi_path)}
+        _INDEX_CACHE[abspath] = (stat_key, index)
+        return index
+
+    return _load_sidecar(gff_file, get_region_index_path(gff_file), REGION_INDEX_VERSION)
+
+
+def ensure_region_index(gff_file):
+    """
+    Load the region index, building and saving a .gsreg sidecar if needed.
+    Returns None for non-seekable (plain gzip) files.
+    """
+    if not is_seekable_annotation(gff_file):
+        return None
+
+    index = load_region_index(gff_file)
+    if index is not None:
+        return index
+
+    index = build_region_index(gff_file)
+    save_path = get_region_index_path(gff_file)
+    _save_sidecar(save_path, index)
+    _cache_sidecar(gff_file, save_path, index)
+    return index
+
+
+def iter_region_lines(gff_file, region_index, seqid, region_start):
+    """
+    Yield decoded GFF lines of seqid, starting from the first line that can
+    overlap region_start. Lines are in file (start-sorted) order, so the
+    caller stops reading once starts pass the region of interest.
+    """
+    windows = region_index["linear"].get(seqid)
+    if not windows:
+        return
+    window = max(region_start - 1, 0) >> LINEAR_SHIFT
+    if window >= len(windows) or windows[window] is None:
+        return
+
+    target = seqid.encode()
+    seen_target = False
+    with open_positional(gff_file) as f:
+        f.seek(windows[window])
+        for raw in f:
+            if raw.startswith(b"#") or not raw.strip():
+                continue
+            if raw.split(b"\t", 1)[0] != target:
+                if seen_target:
+                    return
+                continue
+            seen_target = True
+            yield raw.decode()
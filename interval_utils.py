@@ -0,0 +1,91 @@
+# =====================
+# 区間演算 (閉区間 [start, end], 整数座標)
+# =====================
+
+def merge_intervals(intervals):
+    """
+    Merge overlapping or adjacent closed intervals.
+
+    Args:
+        intervals: Iterable of (start, end) in any order
+
+    Returns:
+        List[tuple]: Sorted, disjoint (start, end) intervals
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals, removals):
+    """
+    Remove a set of intervals from each interval in a single sweep.
+
+    Args:
+        intervals: List of (start, end) in any order (may overlap each other)
+        removals: Iterable of (start, end) to remove
+
+    Returns:
+        List[List[tuple]]: For each input interval (same order), the pieces
+                           that remain, left to right. An interval that does
+                           not touch any removal is returned as [(start, end)].
+    """
+    removed = merge_intervals(removals)
+    result = [None] * len(intervals)
+    if not removed:
+        for i, (start, end) in enumerate(intervals):
+            result[i] = [(start, end)]
+        return result
+
+    # 開始位置順に走査し、既に通り過ぎた削除区間は二度と見ない
+    order = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    j = 0
+    for i in order:
+        start, end = intervals[i]
+        while j < len(removed) and removed[j][1] < start:
+            j += 1
+
+        pieces = []
+        k = j
+        while k < len(removed) and removed[k][0] <= end:
+            rem_start, rem_end = removed[k]
+            if start < rem_start:
+                pieces.append((start, rem_start - 1))
+            start = max(start, rem_end + 1)
+            k += 1
+        if start <= end:
+            pieces.append((start, end))
+        result[i] = pieces
+    return result
+
+
+def intersect_intervals(a, b):
+    """
+    Intersect two sets of intervals.
+
+    Args:
+        a, b: Iterables of (start, end)
+
+    Returns:
+        List[tuple]: Sorted, disjoint (start, end) intervals covered by both
+    """
+    a = merge_intervals(a)
+    b = merge_intervals(b)
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start <= end:
+            result.append((start, end))
+        # 先に終わる方を進める
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
@@ -1,5 +1,26 @@
-from gene_classes import GeneFeature, GeneStructure
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from gene_classes import GeneFeature, GeneStructure, normalize_gene_structures
+from gff_attributes import (
+    parse_attributes,
+    detect_annotation_format,
+    get_id_scanner,
+    normalize_feature_type
+)
+from bgzf_utils import (
+    is_gzip,
+    iter_lines,
+    iter_lines_containing,
+    iter_lines_in_range,
+    split_line_ranges,
+    open_text
+)
+from gff_index import (
+    load_transcript_index,
+    read_indexed_lines,
+    ensure_region_index,
+    iter_region_lines
+)
+from sqlite_store import is_sqlite_store, open_sqlite_store
 
 # =====================
 # INPUTパーサ
@@ -64,109 +85,363 @@ def parse_domains(domain_str):
 # ====================
 
 
-def parse_gff_for_transcript(gff_file, transcript_id):
+def parse_gff_for_transcript(gff_file, transcript_id, use_index=True, use_snapshot=False):
+    """
+    Extract the features of a single transcript.
+
+    If a valid sidecar index (see gff_index.ensure_transcript_index) exists,
+    only the indexed byte ranges are read; otherwise the file is scanned for
+    transcript_id (memory-mapped for uncompressed files).
+    Lines are matched when their ID or one of their Parent values equals
+    transcript_id exactly.
+
+    gff_file may also be a SQLite store (see sqlite_store.build_sqlite_store),
+    in which case the transcript is read with an indexed query.
+
+    Args:
+        gff_file: Path to GFF/GTF file or SQLite store
+        transcript_id: Transcript ID (matched against ID / Parent)
+        use_index: Use the sidecar index if available
+        use_snapshot: Read from the memory-mapped snapshot (<gff>.gssnap),
+                      creating it on first use (requires numpy)
+
+    Returns:
+        GeneStructure or None if the transcript was not found
+    """
+    if is_sqlite_store(gff_file):
+        return open_sqlite_store(gff_file).get_transcript(transcript_id)
+    if use_snapshot:
+        return _get_snapshot(gff_file).get_gene_structure(transcript_id)
+
+    scan_ids = get_id_scanner(detect_annotation_format(gff_file))
+    index = load_transcript_index(gff_file) if use_index else None
+    if index is not None:
+        lines = read_indexed_lines(gff_file, index, transcript_id)
+    else:
+        # インデックスがない場合は transcript_id を含む行だけを取り出す
+        lines = iter_lines_containing(gff_file, transcript_id)
+
     gene_structure = None
-    with open(gff_file) as f:
-        total_lines = sum(1 for _ in f)
-        
-    with open(gff_file) as f:
-        for line in tqdm(f,
-                 total=total_lines,
-                 desc="Parsing GFF",
-                 bar_format="{l_bar}{bar}"):
-
-            if line.startswith("#") or not line.strip():
-                continue
-            parts = line.strip().split("\t")
-            if len(parts) != 9:
-                continue
-            seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
-            if f"Parent={transcript_id}" not in attributes and f"ID={transcript_id}" not in attributes:
-                continue
-            if gene_structure is None:
-                gene_structure = GeneStructure(transcript_id, seqid, strand)
-            
-            feature = GeneFeature(seqid, int(start), int(end), feature_type, strand)
-            gene_structure.add_feature(feature)
-            
+    for line in lines:
+        # 部分文字列で素早く候補を絞り込んでから厳密に照合する
+        if transcript_id not in line or line.startswith("#"):
+            continue
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
+        seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+        feature_id, parents = scan_ids(feature_type, attributes)
+        if feature_id != transcript_id and transcript_id not in parents:
+            continue
+        if gene_structure is None:
+            gene_structure = GeneStructure(transcript_id, seqid, strand)
+
+        feature_type = normalize_feature_type(feature_type)
+        if feature_type is None:
+            continue
+        feature = GeneFeature(seqid, int(start), int(end), feature_type, strand,
+                              raw_attributes=attributes)
+        gene_structure.add_feature(feature)
+
     return gene_structure
 
 
-def parse_gff_for_region(gff_file, seqid, region_start, region_end):
+def parse_gff_for_transcripts(gff_file, transcript_ids, use_index=True, use_snapshot=False):
+    """
+    Extract the features of several transcripts at once.
+
+    Without an index, all requested transcripts are collected in a single
+    streaming pass over the file (instead of one pass per transcript).
+
+    Args:
+        gff_file: Path to GFF/GTF file or SQLite store
+        transcript_ids: Iterable of transcript IDs
+        use_index: Use the sidecar index if available
+        use_snapshot: Read from the memory-mapped snapshot (<gff>.gssnap)
+
+    Returns:
+        dict: {transcript_id: GeneStructure} for the transcripts that were found
+    """
+    wanted = list(dict.fromkeys(transcript_ids))
+
+    # インデックス・スナップショット・SQLite は 1 件ずつ引いても全走査にならない
+    if (is_sqlite_store(gff_file) or use_snapshot
+            or (use_index and load_transcript_index(gff_file) is not None)):
+        gene_structures = {}
+        for transcript_id in wanted:
+            gene = parse_gff_for_transcript(gff_file, transcript_id,
+                                            use_index=use_index, use_snapshot=use_snapshot)
+            if gene is not None:
+                gene_structures[transcript_id] = gene
+        return gene_structures
+
+    scan_ids = get_id_scanner(detect_annotation_format(gff_file))
+    wanted_set = set(wanted)
+    gene_structures = {}
+
+    for line in iter_lines(gff_file, desc="Parsing GFF"):
+        if line.startswith("#"):
+            continue
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
+        seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+        feature_id, parents = scan_ids(feature_type, attributes)
+
+        matched = [p for p in parents if p in wanted_set]
+        if feature_id in wanted_set:
+            matched.append(feature_id)
+        if not matched:
+            continue
+        matched = dict.fromkeys(matched)  # 重複を除く（順序は保持）
+
+        for transcript_id in matched:
+            if transcript_id not in gene_structures:
+                gene_structures[transcript_id] = GeneStructure(transcript_id, seqid, strand)
+
+        feature_type = normalize_feature_type(feature_type)
+        if feature_type is None:
+            continue
+        for transcript_id in matched:
+            feature = GeneFeature(seqid, int(start), int(end), feature_type, strand,
+                                  raw_attributes=attributes)
+            gene_structures[transcript_id].add_feature(feature)
+
+    return gene_structures
+
+
+def parse_gff_for_region(gff_file, seqid, region_start, region_end, use_index=True, use_snapshot=False,
+                         workers=1, normalize=False):
     """
     Extract all transcripts within the specified genomic region.
 
+    For coordinate-sorted files (plain or bgzip-compressed) a linear region
+    index (tabix .tbi or a .gsreg sidecar built on first use) is used so
+    that only the lines around the region are read. A SQLite store is queried
+    through its interval index instead.
+
     Args:
-        gff_file: Path to GFF/GTF file
+        gff_file: Path to GFF/GTF file or SQLite store
         seqid: Chromosome/SeqID
         region_start: Region start position (1-based)
         region_end: Region end position (1-based)
+        use_index: Use (and build if missing) the region index
+        use_snapshot: Read from the memory-mapped snapshot (<gff>.gssnap),
+                      creating it on first use (requires numpy)
+        workers: Number of processes for the full-file scan (used when no
+                 region index applies; uncompressed files only)
+        normalize: Return normalized transcripts (see
+                   gene_classes.normalize_gene_structures); with use_snapshot
+                   normalization runs directly on the column arrays
 
     Returns:
         List[GeneStructure]: List of GeneStructure objects for transcripts
                              that overlap with the specified region
     """
+    if use_snapshot and not is_sqlite_store(gff_file):
+        return _get_snapshot(gff_file).parse_region(seqid, region_start, region_end, normalize=normalize)
+
+    genes = _parse_region(gff_file, seqid, region_start, region_end, use_index, workers)
+    if normalize:
+        normalize_gene_structures(genes)
+    return genes
+
+
+def _parse_region(gff_file, seqid, region_start, region_end, use_index, workers):
+    if is_sqlite_store(gff_file):
+        return open_sqlite_store(gff_file).get_region(seqid, region_start, region_end)
+
+    scan_ids = get_id_scanner(detect_annotation_format(gff_file))
+    region_index = ensure_region_index(gff_file) if use_index else None
+    if region_index is not None and region_index["sorted"]:
+        return _parse_indexed_region(gff_file, region_index, scan_ids, seqid, region_start, region_end)
+
+    if workers > 1 and not is_gzip(gff_file):
+        return _parse_region_parallel(gff_file, seqid, region_start, region_end, workers)
+
     # First pass: find all mRNA/transcript IDs in the region
-    transcript_ids = set()
+    with open_text(gff_file) as f:
+        transcript_info = _find_region_transcripts(f, scan_ids, seqid, region_start, region_end)
+
+    # Second pass: collect features for each transcript
+    with open_text(gff_file) as f:
+        candidates = _collect_region_candidates(f, scan_ids, transcript_info)
+
+    return _build_region_structures(candidates, transcript_info)
+
+
+def _find_region_transcripts(lines, scan_ids, seqid, region_start, region_end):
+    """領域と重なる mRNA/transcript を探す。transcript_id -> (seqid, strand)"""
+    transcript_info = {}
+
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
+
+        line_seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+
+        # Check if this is on the target chromosome
+        if line_seqid != seqid:
+            continue
+
+        # Look for mRNA or transcript features
+        if feature_type in ('mRNA', 'transcript'):
+            # Check if overlaps with region
+            if int(end) >= region_start and int(start) <= region_end:
+                # Extract ID from attributes
+                transcript_id, _ = scan_ids(feature_type, attributes)
+                if transcript_id:
+                    transcript_info[transcript_id] = (line_seqid, strand)
+
+    return transcript_info
+
+
+def _collect_region_candidates(lines, scan_ids, transcript_info):
+    """transcript_info の transcript に属する行を (feature_id, parents, parts) のリストで返す"""
+    candidates = []
+
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
+
+        # Check if this feature belongs to one of our transcripts
+        feature_id, parents = scan_ids(parts[2], parts[8])
+        if feature_id in transcript_info or any(p in transcript_info for p in parents):
+            candidates.append((feature_id, parents, parts))
+
+    return candidates
+
+
+# =====================
+# 並列パーサ (複数プロセス)
+# ====================
+
+def _find_region_transcripts_chunk(gff_file, begin, end, annotation_format, seqid, region_start, region_end):
+    lines = iter_lines_in_range(gff_file, begin, end)
+    return _find_region_transcripts(lines, get_id_scanner(annotation_format), seqid, region_start, region_end)
+
+
+def _collect_region_candidates_chunk(gff_file, begin, end, annotation_format, transcript_info):
+    lines = iter_lines_in_range(gff_file, begin, end)
+    return _collect_region_candidates(lines, get_id_scanner(annotation_format), transcript_info)
+
+
+def _parse_region_parallel(gff_file, seqid, region_start, region_end, workers):
+    """
+    Parallel version of the two-pass region scan.
+
+    The file is split into newline-aligned byte ranges, each pass is run on
+    the ranges in a process pool, and the per-range results are merged in
+    file order, so the result is identical to the single-process scan.
+    """
+    annotation_format = detect_annotation_format(gff_file)
+    ranges = split_line_ranges(gff_file, workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        transcript_info = {}
+        futures = [
+            executor.submit(_find_region_transcripts_chunk, gff_file, begin, end,
+                            annotation_format, seqid, region_start, region_end)
+            for begin, end in ranges
+        ]
+        for future in futures:
+            transcript_info.update(future.result())
+
+        candidates = []
+        futures = [
+            executor.submit(_collect_region_candidates_chunk, gff_file, begin, end,
+                            annotation_format, transcript_info)
+            for begin, end in ranges
+        ]
+        for future in futures:
+            candidates.extend(future.result())
+
+    return _build_region_structures(candidates, transcript_info)
+
+
+def _get_snapshot(gff_file):
+    # numpy は任意依存のため、スナップショット使用時のみ import する
+    from gff_columns import ensure_snapshot
+    return ensure_snapshot(gff_file)
+
+
+def _parse_indexed_region(gff_file, region_index, scan_ids, seqid, region_start, region_end):
+    """
+    領域インデックスを使って、領域周辺の行だけを読んで transcript を集める。
+
+    座標ソート済みファイルでは、親と同じ開始位置の子 feature が親より前に
+    並ぶことがあり、領域の先頭より前から始まる transcript の子も領域の
+    ウィンドウより前にある。そのため 1 回目で transcript を見つけ、
+    2 回目は最も左の transcript の開始位置から読み直して子 feature を集める。
+    """
     transcript_info = {}  # transcript_id -> (seqid, strand)
+    scan_start = region_start
+    scan_limit = region_end
+
+    # 1 回目: 領域と重なる mRNA/transcript を探す
+    for line in iter_region_lines(gff_file, region_index, seqid, region_start):
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
 
-    with open(gff_file) as f:
-        for line in f:
-            if line.startswith("#") or not line.strip():
-                continue
-            parts = line.strip().split("\t")
-            if len(parts) != 9:
-                continue
-
-            line_seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
-            start, end = int(start), int(end)
-
-            # Check if this is on the target chromosome
-            if line_seqid != seqid:
-                continue
-
-            # Look for mRNA or transcript features
-            if feature_type in ('mRNA', 'transcript'):
-                # Check if overlaps with region
-                if end >= region_start and start <= region_end:
-                    # Extract ID from attributes
-                    attr_dict = parse_attributes(attributes)
-                    transcript_id = attr_dict.get('ID')
-                    if transcript_id:
-                        transcript_ids.add(transcript_id)
-                        transcript_info[transcript_id] = (line_seqid, strand)
+        line_seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+        start, end = int(start), int(end)
 
-    # Second pass: collect features for each transcript
-    gene_structures = {}
+        # 開始位置でソート済みなので、これ以降に領域と重なる行はない
+        if start > region_end:
+            break
 
-    with open(gff_file) as f:
-        for line in f:
-            if line.startswith("#") or not line.strip():
-                continue
-            parts = line.strip().split("\t")
-            if len(parts) != 9:
-                continue
+        if feature_type in ('mRNA', 'transcript') and end >= region_start:
+            feature_id, _ = scan_ids(feature_type, attributes)
+            if feature_id:
+                transcript_info[feature_id] = (line_seqid, strand)
+                # 領域外に伸びる子 feature も拾えるよう走査範囲を広げる
+                scan_start = min(scan_start, start)
+                scan_limit = max(scan_limit, end)
 
-            line_seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
-            start, end = int(start), int(end)
+    if not transcript_info:
+        return []
+
+    # 2 回目: transcript の範囲を読み直して、属する行を集める
+    candidates = []
+    for line in iter_region_lines(gff_file, region_index, seqid, scan_start):
+        parts = line.strip().split("\t")
+        if len(parts) != 9:
+            continue
+        if int(parts[3]) > scan_limit:
+            break
 
-            # Parse attributes
-            attr_dict = parse_attributes(attributes)
+        feature_id, parents = scan_ids(parts[2], parts[8])
+        if feature_id in transcript_info or any(p in transcript_info for p in parents):
+            candidates.append((feature_id, parents, parts))
 
-            # Check if this feature belongs to one of our transcripts
-            parent_id = attr_dict.get('Parent')
-            feature_id = attr_dict.get('ID')
+    return _build_region_structures(candidates, transcript_info)
+
+
+def _build_region_structures(candidates, transcript_info):
+    """
+    候補行を transcript ごとにまとめる。
+    Parent が一致すればその transcript（複数可）に、なければ ID が一致する transcript に属する。
+    """
+    gene_structures = {}
 
-            # Match by Parent or ID
-            matched_transcript = None
-            if parent_id in transcript_ids:
-                matched_transcript = parent_id
-            elif feature_id in transcript_ids:
-                matched_transcript = feature_id
+    for feature_id, parents, parts in candidates:
+        owners = [p for p in parents if p in transcript_info]
+        if not owners and feature_id in transcript_info:
+            owners = [feature_id]
 
-            if matched_transcript is None:
-                continue
+        line_seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+        feature_type = normalize_feature_type(feature_type)
+        if feature_type is None:
+            continue
 
+        for matched_transcript in owners:
             # Create GeneStructure if not exists
             if matched_transcript not in gene_structures:
                 t_seqid, t_strand = transcript_info[matched_transcript]
@@ -175,9 +450,9 @@ def parse_gff_for_region(gff_file, seqid, region_start, region_end):
                 )
 
             # Add feature (keep original genomic coordinates for region mode)
-            gene = gene_structures[matched_transcript]
-            feature = GeneFeature(line_seqid, start, end, feature_type, strand)
-            gene.add_feature(feature)
+            feature = GeneFeature(line_seqid, int(start), int(end), feature_type, strand,
+                                  raw_attributes=attributes)
+            gene_structures[matched_transcript].add_feature(feature)
 
     # Sort by start position and return as list
     result = list(gene_structures.values())
@@ -186,26 +461,6 @@ def parse_gff_for_region(gff_file, seqid, region_start, region_end):
     return result
 
 
-def parse_attributes(attr_string):
-    """
-    Parse GFF3 attribute string into a dictionary.
-
-    Args:
-        attr_string: Attribute string (e.g., "ID=mRNA1;Parent=gene1;Name=foo")
-
-    Returns:
-        dict: Attribute key-value pairs
-    """
-    attr_dict = {}
-    for item in attr_string.split(';'):
-        item = item.strip()
-        if '=' in item:
-            key, value = item.split('=', 1)
-            attr_dict[key] = value
-    return attr_dict
-
-
-
 def get_terminal_feature(features, strand='+'):
     """
     3'端にある feature を返す。
@@ -0,0 +1,305 @@
+import json
+import os
+import sqlite3
+from bgzf_utils import iter_lines
+from gene_classes import GeneFeature, GeneStructure
+from gff_attributes import detect_annotation_format, get_id_scanner, normalize_feature_type
+from gff_index import get_file_signature
+
+# =====================
+# SQLite アノテーションストア
+# =====================
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+STORE_VERSION = 2
+
+TRANSCRIPT_TYPES = ('mRNA', 'transcript')
+
+# executemany に渡す行数
+_BATCH_SIZE = 50000
+
+# プロセス内キャッシュ: abspath -> ((size, mtime_ns), AnnotationStore)
+_STORE_CACHE = {}
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE seqids (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE transcripts (
+    id INTEGER PRIMARY KEY,
+    transcript_id TEXT UNIQUE,
+    seqid TEXT,
+    strand TEXT,
+    start INTEGER,
+    end INTEGER,
+    first_line INTEGER
+);
+CREATE TABLE features (
+    transcript INTEGER,
+    line INTEGER,
+    seqid TEXT,
+    start INTEGER,
+    end INTEGER,
+    feature_type TEXT,
+    strand TEXT,
+    attributes TEXT
+);
+CREATE TEMP TABLE raw_lines (
+    line INTEGER PRIMARY KEY,
+    seqid TEXT,
+    start INTEGER,
+    end INTEGER,
+    feature_type TEXT,
+    strand TEXT,
+    attributes TEXT
+);
+CREATE TEMP TABLE raw_keys (line INTEGER, key TEXT, is_parent INTEGER);
+"""
+
+
+def is_sqlite_store(path):
+    """SQLite データベースファイルかどうかをヘッダで判定する"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(16) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def _has_rtree(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.rtree_probe USING rtree_i32(id, a, b)")
+        conn.execute("DROP TABLE temp.rtree_probe")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def build_sqlite_store(gff_file, db_path):
+    """
+    Import a GFF/GTF into a SQLite database.
+
+    Transcript features are stored with an index on (transcript, line), and
+    transcript extents are indexed with an R*Tree over (seqid code, start,
+    end). If the SQLite build has no R*Tree module, a (seqid, start) index
+    bounded by the longest transcript is used instead.
+
+    The database is written to a temporary file and renamed into place, so
+    other processes never see a half-written store.
+
+    Args:
+        gff_file: Path to a plain or compressed GFF/GTF file
+        db_path: Output database path
+    """
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    scan_ids = get_id_scanner(detect_annotation_format(gff_file))
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(_SCHEMA)
+        use_rtree = _has_rtree(conn)
+
+        raw_lines, raw_keys, transcripts = [], [], []
+
+        def _flush():
+            conn.executemany("INSERT INTO raw_lines VALUES (?, ?, ?, ?, ?, ?, ?)", raw_lines)
+            conn.executemany("INSERT INTO raw_keys VALUES (?, ?, ?)", raw_keys)
+            conn.executemany(
+                "INSERT OR IGNORE INTO transcripts (transcript_id, seqid, strand) VALUES (?, ?, ?)",
+                transcripts
+            )
+            raw_lines.clear()
+            raw_keys.clear()
+            transcripts.clear()
+
+        for line_no, line in enumerate(iter_lines(gff_file, desc="Importing GFF")):
+            if line.startswith("#") or not line.strip():
+                continue
+            parts = line.strip().split("\t")
+            if len(parts) != 9:
+                continue
+            seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+
+            feature_id, parents = scan_ids(feature_type, attributes)
+            if feature_type in TRANSCRIPT_TYPES and feature_id:
+                transcripts.append((feature_id, seqid, strand))
+
+            feature_type = normalize_feature_type(feature_type)
+            if feature_type is None:
+                continue
+            raw_lines.append((line_no, seqid, int(start), int(end), feature_type, strand, attributes))
+            if feature_id:
+                raw_keys.append((line_no, feature_id, 0))
+            raw_keys.extend((line_no, p, 1) for p in parents)
+
+            if len(raw_lines) >= _BATCH_SIZE:
+                _flush()
+        _flush()
+
+        # Parent が transcript ならその transcript（複数可）に、なければ自身の ID の transcript に属する
+        conn.executescript("""
+            CREATE INDEX temp.raw_keys_key ON raw_keys(key);
+            CREATE TEMP TABLE owners AS
+                SELECT k.line AS line, t.id AS transcript
+                FROM raw_keys k JOIN transcripts t ON t.transcript_id = k.key
+                WHERE k.is_parent = 1;
+            CREATE INDEX temp.owners_line ON owners(line);
+            INSERT INTO owners
+                SELECT k.line, t.id
+                FROM raw_keys k JOIN transcripts t ON t.transcript_id = k.key
+                WHERE k.is_parent = 0
+                  AND NOT EXISTS (SELECT 1 FROM owners o WHERE o.line = k.line);
+            INSERT INTO features
+                SELECT o.transcript, l.line, l.seqid, l.start, l.end, l.feature_type, l.strand, l.attributes
+                FROM owners o JOIN raw_lines l ON l.line = o.line
+                ORDER BY o.transcript, l.line;
+            CREATE INDEX features_transcript ON features(transcript, line);
+            UPDATE transcripts SET
+                start = (SELECT MIN(f.start) FROM features f WHERE f.transcript = transcripts.id),
+                end = (SELECT MAX(f.end) FROM features f WHERE f.transcript = transcripts.id),
+                first_line = (SELECT MIN(f.line) FROM features f WHERE f.transcript = transcripts.id);
+            INSERT INTO seqids (name) SELECT DISTINCT seqid FROM transcripts ORDER BY seqid;
+        """)
+
+        if use_rtree:
+            conn.executescript("""
+                CREATE VIRTUAL TABLE transcript_rtree USING rtree_i32(id, seq_lo, seq_hi, start, end);
+                INSERT INTO transcript_rtree
+                    SELECT t.id, s.id, s.id, t.start, t.end
+                    FROM transcripts t JOIN seqids s ON s.name = t.seqid
+                    WHERE t.start IS NOT NULL;
+            """)
+        else:
+            conn.execute("CREATE INDEX transcripts_pos ON transcripts(seqid, start)")
+
+        max_length = conn.execute("SELECT COALESCE(MAX(end - start), 0) FROM transcripts").fetchone()[0]
+        meta = {
+            "version": STORE_VERSION,
+            "signature": get_file_signature(gff_file),
+            "rtree": use_rtree,
+            "max_transcript_length": max_length,
+        }
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, db_path)
+
+
+class AnnotationStore:
+    """
+    Read-only query interface to a database written by build_sqlite_store().
+
+    Connections are opened read-only and immutable, so any number of
+    processes can query the same database concurrently without locking.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # 書き込みは一時ファイル + rename でしか行わないので、開いたファイルは変更されない
+        self.conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro&immutable=1", uri=True)
+        self.meta = {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def close(self):
+        self.conn.close()
+
+    def _build_structures(self, rows):
+        """(transcript_id, t_seqid, t_strand, seqid, start, end, type, strand, attributes) 行から GeneStructure を作る"""
+        gene_structures = {}
+        for transcript_id, t_seqid, t_strand, seqid, start, end, feature_type, strand, attributes in rows:
+            gene = gene_structures.get(transcript_id)
+            if gene is None:
+                gene = gene_structures[transcript_id] = GeneStructure(transcript_id, t_seqid, t_strand)
+            gene.add_feature(GeneFeature(seqid, start, end, feature_type, strand, raw_attributes=attributes))
+        return list(gene_structures.values())
+
+    def get_transcript(self, transcript_id):
+        """parse_gff_for_transcript と同じ GeneStructure を返す（見つからなければ None）"""
+        rows = self.conn.execute("""
+            SELECT t.transcript_id, t.seqid, t.strand,
+                   f.seqid, f.start, f.end, f.feature_type, f.strand, f.attributes
+            FROM transcripts t JOIN features f ON f.transcript = t.id
+            WHERE t.transcript_id = ?
+            ORDER BY f.line
+        """, (transcript_id,))
+        genes = self._build_structures(rows)
+        return genes[0] if genes else None
+
+    def get_region(self, seqid, region_start, region_end):
+        """
+        parse_gff_for_region と同じ GeneStructure のリストを返す。
+        開始位置が同じ transcript はファイル中で最初に現れた順に並べる（トラックの割り当てが変わらないように）
+        """
+        if self.meta.get("rtree"):
+            id_query = """
+                SELECT r.id FROM transcript_rtree r
+                WHERE r.seq_lo <= (SELECT id FROM seqids WHERE name = :seqid)
+                  AND r.seq_hi >= (SELECT id FROM seqids WHERE name = :seqid)
+                  AND r.end >= :start AND r.start <= :end
+            """
+        else:
+            id_query = """
+                SELECT id FROM transcripts
+                WHERE seqid = :seqid AND start <= :end
+                  AND start >= :start - :max_length AND end >= :start
+            """
+        rows = self.conn.execute(f"""
+            SELECT t.transcript_id, t.seqid, t.strand,
+                   f.seqid, f.start, f.end, f.feature_type, f.strand, f.attributes
+            FROM transcripts t JOIN features f ON f.transcript = t.id
+            WHERE t.id IN ({id_query})
+            ORDER BY t.start, t.first_line, f.line
+        """, {
+            "seqid": seqid, "start": region_start, "end": region_end,
+            "max_length": self.meta.get("max_transcript_length", 0),
+        })
+        return self._build_structures(rows)
+
+
+def load_sqlite_store(db_path, gff_file=None):
+    """
+    Open a store. If gff_file is given, the store is only returned when it
+    was imported from the current version of that file.
+
+    Returns:
+        AnnotationStore or None
+    """
+    if not is_sqlite_store(db_path):
+        return None
+    store = AnnotationStore(db_path)
+    if store.meta.get("version") != STORE_VERSION:
+        store.close()
+        return None
+    if gff_file is not None and store.meta.get("signature") != get_file_signature(gff_file):
+        store.close()
+        return None
+    return store
+
+
+def open_sqlite_store(db_path):
+    """同じプロセス内では接続を使い回す"""
+    abspath = os.path.abspath(db_path)
+    st = os.stat(db_path)
+    stat_key = (st.st_size, st.st_mtime_ns)
+    cached = _STORE_CACHE.get(abspath)
+    if cached and cached[0] == stat_key:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    store = AnnotationStore(db_path)
+    _STORE_CACHE[abspath] = (stat_key, store)
+    return store
+
+
+def ensure_sqlite_store(gff_file, db_path):
+    """
+    Make sure db_path holds an up-to-date import of gff_file, (re)building
+    it if it is missing or was imported from a different version of the file.
+    """
+    store = load_sqlite_store(db_path, gff_file) if os.path.exists(db_path) else None
+    if store is not None:
+        store.close()
+        return
+    build_sqlite_store(gff_file, db_path)
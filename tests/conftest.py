@@ -0,0 +1,114 @@
+import os
+import random
+import shutil
+import struct
+import sys
+import zlib
+
+import pytest
+
+# モジュールはリポジトリ直下にあるので、そのまま import できるようにする
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+sys.path.insert(0, REPO_ROOT)
+
+
+# =====================
+# テスト用ヘルパー
+# =====================
+
+def _bgzf_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    return (header + struct.pack("<H", len(cdata) + 25) + cdata
+            + struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data)))
+
+
+def write_bgzf(src, dst, block_size=65280):
+    """src を BGZF で圧縮して dst に書く（小さい block_size でブロック境界を増やせる）"""
+    with open(src, "rb") as f:
+        data = f.read()
+    with open(dst, "wb") as out:
+        for i in range(0, len(data), block_size):
+            out.write(_bgzf_block(data[i:i + block_size]))
+        out.write(_bgzf_block(b""))  # EOF ブロック
+    return dst
+
+
+def write_sorted_gff(path, n_genes, seed=0):
+    """
+    ランダムな遺伝子モデルを sort -k1,1 -k4,4n と同じ順序で書き出す。
+    同じ開始位置の子 feature は行全体の比較で親 (gene/mRNA) より前に並ぶ。
+    """
+    rng = random.Random(seed)
+    lines = []
+    for seqid in ("chr1", "chr2"):
+        pos = 1
+        for i in range(n_genes):
+            gene_id = f"{seqid}_g{i}"
+            strand = rng.choice("+-")
+            gene_start, gene_end = None, 0
+            gene_lines = []
+            for k in range(rng.randint(1, 3)):
+                transcript_id = f"{gene_id}.t{k + 1}"
+                start = pos + rng.choice((0, 0, rng.randint(1, 500)))
+                exons = []
+                for _ in range(rng.randint(1, 6)):
+                    end = start + rng.randint(50, 3000)
+                    exons.append((start, end))
+                    start = end + rng.randint(50, 8000)
+                cds_start = exons[0][0] + rng.choice((0, rng.randint(1, 40)))
+                cds_end = exons[-1][1] - rng.choice((0, rng.randint(1, 40)))
+                gene_lines.append((seqid, "mRNA", exons[0][0], exons[-1][1], strand,
+                                   f"ID={transcript_id};Parent={gene_id}"))
+                for s, e in exons:
+                    gene_lines.append((seqid, "exon", s, e, strand, f"Parent={transcript_id}"))
+                    if max(s, cds_start) <= min(e, cds_end):
+                        gene_lines.append((seqid, "CDS", max(s, cds_start), min(e, cds_end),
+                                           strand, f"Parent={transcript_id}"))
+                    if s < cds_start:
+                        gene_lines.append((seqid, "five_prime_UTR", s, min(e, cds_start - 1),
+                                           strand, f"Parent={transcript_id}"))
+                gene_start = exons[0][0] if gene_start is None else min(gene_start, exons[0][0])
+                gene_end = max(gene_end, exons[-1][1])
+            gene_lines.append((seqid, "gene", gene_start, gene_end, strand, f"ID={gene_id}"))
+            lines.extend(gene_lines)
+            # 遺伝子同士が重なることもある
+            pos = gene_start + rng.randint(1000, 40000)
+
+    text = [f"{c}\tsrc\t{t}\t{s}\t{e}\t.\t{st}\t.\t{a}\n" for c, t, s, e, st, a in lines]
+    text.sort(key=lambda line: (line.split("\t")[0], int(line.split("\t")[3]), line))
+    with open(path, "w") as f:
+        f.write("##gff-version 3\n")
+        f.writelines(text)
+    return path
+
+
+def random_queries(n, seed=1):
+    """write_sorted_gff のファイル向けのランダムな (seqid, start, end)"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        start = rng.randint(1, 400000)
+        queries.append((rng.choice(("chr1", "chr2")), start, start + rng.randint(0, 20000)))
+    return queries
+
+
+def summarize(genes):
+    """GeneStructure のリストを比較しやすいタプルにする"""
+    return sorted(
+        (gene.gene_id, gene.strand,
+         tuple(sorted((f.feature_type, f.start, f.end) for f in gene.features)))
+        for gene in genes
+    )
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    """tests/data のファイルを一時ディレクトリへコピーして返す（インデックスは一時ディレクトリに作られる）"""
+    def copy(name):
+        dst = tmp_path / name
+        shutil.copy(os.path.join(DATA_DIR, name), dst)
+        return str(dst)
+    return copy
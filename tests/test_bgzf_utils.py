@@ -0,0 +1,86 @@
+import gzip
+
+from bgzf_utils import (
+    BgzfReader, is_bgzf, is_gzip, iter_lines, iter_lines_containing, iter_lines_in_range,
+    make_virtual_offset, split_line_ranges, split_virtual_offset, open_text,
+)
+from conftest import write_bgzf
+
+
+def write_lines(path, n):
+    lines = [f"line{i}\t{'x' * (i % 37)}\n" for i in range(n)]
+    with open(path, "w") as f:
+        f.writelines(lines)
+    return lines
+
+
+def test_virtual_offset_roundtrip():
+    voffset = make_virtual_offset(123456, 789)
+    assert split_virtual_offset(voffset) == (123456, 789)
+
+
+def test_magic_detection(tmp_path):
+    plain = str(tmp_path / "a.txt")
+    write_lines(plain, 10)
+    bgzf = write_bgzf(plain, str(tmp_path / "a.txt.gz"))
+    gz = str(tmp_path / "b.txt.gz")
+    with open(plain, "rb") as src, gzip.open(gz, "wb") as dst:
+        dst.write(src.read())
+
+    assert not is_gzip(plain) and not is_bgzf(plain)
+    assert is_gzip(bgzf) and is_bgzf(bgzf)
+    assert is_gzip(gz) and not is_bgzf(gz)
+
+
+def test_reader_lines_across_blocks(tmp_path):
+    plain = str(tmp_path / "a.txt")
+    lines = write_lines(plain, 500)
+    # 小さいブロックで行がブロック境界をまたぐようにする
+    bgzf = write_bgzf(plain, str(tmp_path / "a.txt.gz"), block_size=101)
+
+    with BgzfReader(bgzf) as reader:
+        assert [raw.decode() for raw in reader] == lines
+
+
+def test_reader_seek_to_told_offsets(tmp_path):
+    plain = str(tmp_path / "a.txt")
+    lines = write_lines(plain, 300)
+    bgzf = write_bgzf(plain, str(tmp_path / "a.txt.gz"), block_size=101)
+
+    offsets = []
+    with BgzfReader(bgzf) as reader:
+        while True:
+            offsets.append(reader.tell())
+            if not reader.readline():
+                break
+
+        for i in (250, 0, 17, 299, 128):
+            reader.seek(offsets[i])
+            assert reader.readline().decode() == lines[i]
+        reader.seek(offsets[-1])
+        assert reader.readline() == b""
+
+        reader.seek(offsets[5])
+        assert reader.read(len(lines[5]) + 4).decode() == lines[5] + lines[6][:4]
+
+
+def test_text_readers_on_compressed_files(tmp_path):
+    plain = str(tmp_path / "a.txt")
+    lines = write_lines(plain, 200)
+    bgzf = write_bgzf(plain, str(tmp_path / "a.txt.gz"), block_size=101)
+
+    with open_text(bgzf) as f:
+        assert list(f) == lines
+    assert list(iter_lines(bgzf, desc="test")) == lines
+    assert list(iter_lines_containing(bgzf, "line19\t")) == [lines[19]]
+    assert list(iter_lines_containing(plain, "line19\t")) == [lines[19]]
+
+
+def test_line_ranges_cover_file(tmp_path):
+    plain = str(tmp_path / "a.txt")
+    lines = write_lines(plain, 200)
+
+    for n_chunks in (1, 3, 7, 500):
+        ranges = split_line_ranges(plain, n_chunks)
+        collected = [line for begin, end in ranges for line in iter_lines_in_range(plain, begin, end)]
+        assert collected == lines
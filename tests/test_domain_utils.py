@@ -0,0 +1,33 @@
+from domain_utils import load_domain_hits, load_protein_map
+
+
+def test_protein_map(data_file):
+    assert load_protein_map(data_file("protein_map.tsv")) == {"P1": "tA.1", "P2": "tB.1"}
+
+
+def test_interproscan_columns(data_file):
+    hits = load_domain_hits(data_file("domains.tsv"))
+    # protein (1), signature accession (5), start (7), stop (8)
+    assert hits == {
+        "P1": [(28, 260, "SM00220"), (30, 250, "PF00069")],
+        "P2": [(5, 70, "PF00076")],
+        "tX.1": [(10, 60, "PF00010")],
+    }
+
+
+def test_domtblout_columns(data_file):
+    hits = load_domain_hits(data_file("domains.domtblout"))
+    # target name (1) を名前に、query name (4) と ali coord (18, 19) を使う
+    assert hits == {
+        "P1": [(32, 249, "Pkinase")],
+        "P2": [(6, 71, "RRM_1"), (140, 205, "RRM_1")],
+        "tX.1": [(11, 59, "HLH")],
+    }
+
+
+def test_protein_map_and_transcript_filter(data_file):
+    protein_map = load_protein_map(data_file("protein_map.tsv"))
+    for name in ("domains.tsv", "domains.domtblout"):
+        hits = load_domain_hits(data_file(name), protein_map, transcript_ids=["tA.1", "tX.1"])
+        # マップにないタンパク質は transcript と同じ ID とみなす
+        assert set(hits) == {"tA.1", "tX.1"}
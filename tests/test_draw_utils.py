@@ -0,0 +1,27 @@
+from config import SVG_SYMBOL_MIN_USES
+from draw_utils import SvgEmitter, add_glyph, snp_tick
+
+
+def draw_ticks(n):
+    dwg = SvgEmitter("test.svg", size=("100px", "50px"), precision=3)
+    symbols = {}
+    paint = {'stroke': 'black', 'stroke_width': 1}
+    for i in range(n):
+        add_glyph(dwg, symbols, ('snp', 10, 'black'), i * 5, 20,
+                  lambda x, y: snp_tick(dwg, x, y, 10, paint))
+    return dwg.tostring()
+
+
+def test_rare_glyphs_are_drawn_inline():
+    svg = draw_ticks(SVG_SYMBOL_MIN_USES - 1)
+    assert "<symbol" not in svg and "<use" not in svg
+    assert svg.count("<line") == SVG_SYMBOL_MIN_USES - 1
+
+
+def test_repeated_glyphs_become_one_symbol():
+    n = SVG_SYMBOL_MIN_USES + 5
+    svg = draw_ticks(n)
+    assert svg.count("<symbol") == 1
+    assert svg.count("<use") == n - (SVG_SYMBOL_MIN_USES - 1)
+    # <symbol> の中の 1 本 + その場に描いた分
+    assert svg.count("<line") == 1 + SVG_SYMBOL_MIN_USES - 1
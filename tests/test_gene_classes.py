@@ -0,0 +1,43 @@
+from gene_classes import CdsMap, GeneFeature, GeneStructure
+
+
+def make_gene():
+    gene = GeneStructure("t1", "chr1", "+")
+    # CDS は開始位置順でなくてもよい
+    for start, end, feature_type in [(101, 130, 'CDS'), (1, 200, 'exon'), (1, 30, 'CDS'), (201, 209, 'CDS')]:
+        gene.add_feature(GeneFeature("chr1", start, end, feature_type, "+"))
+    return gene
+
+
+def test_cds_map_ranges():
+    cds_map = CdsMap(make_gene().get_features_by_type('CDS'))
+    assert len(cds_map) == 3
+    assert cds_map.map_cdna_range(1, 30) == [(1, 30)]
+    assert cds_map.map_cdna_range(13, 45) == [(13, 30), (101, 115)]
+    assert cds_map.map_protein_range(10, 23) == [(28, 30), (101, 130), (201, 209)]
+    assert cds_map.map_cdna_range(70, 80) == []
+
+
+def test_add_domains_from_protein_coords():
+    gene = make_gene()
+    gene.add_domains_from_protein_coords([(5, 15, "PF1"), (30, 40, "PF2")])
+    domains = gene.get_features_by_type('domain')
+    assert [(f.start, f.end) for f in domains] == [(13, 30), (101, 115)]
+    assert {f.attributes['name'] for f in domains} == {"PF1"}
+
+
+def test_features_cannot_be_mutated_in_place():
+    gene = make_gene()
+    assert isinstance(gene.features, tuple)
+    assert len(gene.get_features_by_type('CDS')) == 3
+
+    gene.add_feature(GeneFeature("chr1", 300, 310, 'CDS', "+"))
+    assert len(gene.features) == 5
+    assert len(gene.get_features_by_type('CDS')) == 4
+
+    # 代入したリストをあとで書き換えても影響しない
+    features = [f for f in gene.features if f.feature_type != 'exon']
+    gene.features = features
+    features.clear()
+    assert len(gene.features) == 4
+    assert [f.start for f in gene.get_features_by_type('CDS')] == [1, 101, 201, 300]
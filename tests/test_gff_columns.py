@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import random_queries, write_sorted_gff
+from parse_utils import parse_gff_for_region
+
+np = pytest.importorskip("numpy")
+import gff_columns  # noqa: E402
+
+
+def ordered(genes):
+    """並び順（トラックの割り当て）も含めて比較できる形にする"""
+    return [
+        (g.gene_id, g.seqid, g.strand, [(f.feature_type, f.start, f.end, f.strand) for f in g.features])
+        for g in genes
+    ]
+
+
+def assert_snapshot_matches_parser(gff_file, queries):
+    for seqid, start, end in queries:
+        from_snapshot = parse_gff_for_region(gff_file, seqid, start, end, use_snapshot=True)
+        from_gff = parse_gff_for_region(gff_file, seqid, start, end, use_index=False, use_snapshot=False)
+        assert ordered(from_snapshot) == ordered(from_gff), (seqid, start, end)
+
+
+def test_snapshot_region_order(data_file):
+    gff_file = data_file("sorted.gff")
+    # chr2 の t5.*, t6.* は開始位置が同じで、ファイル中の出現順と ID の辞書順が異なる
+    genes = parse_gff_for_region(gff_file, "chr2", 7000, 9000, use_snapshot=True)
+    assert [g.gene_id for g in genes] == ["t6.b", "t6.a"]
+
+    assert_snapshot_matches_parser(gff_file, [
+        ("chr1", 30000, 30500), ("chr1", 100, 150), ("chr1", 1, 42000),
+        ("chr2", 1, 1000), ("chr2", 5000, 5000), ("chr2", 1, 9000), ("chr3", 1, 100),
+    ])
+
+
+def test_snapshot_region_order_on_random_file(tmp_path):
+    gff_file = write_sorted_gff(str(tmp_path / "random.gff"), 40)
+    assert_snapshot_matches_parser(gff_file, random_queries(60))
+
+
+def test_snapshot_is_reloaded_from_disk(data_file):
+    gff_file = data_file("sorted.gff")
+    built = gff_columns.ensure_snapshot(gff_file)
+    # プロセス内キャッシュを捨てて、保存した .npy を読み直す
+    gff_columns._SNAPSHOT_CACHE.clear()
+    loaded = gff_columns.load_snapshot(gff_file)
+    assert loaded is not None and loaded is not built
+    for built_array, loaded_array in zip(built.transcript_extents(), loaded.transcript_extents()):
+        assert np.array_equal(built_array, loaded_array)
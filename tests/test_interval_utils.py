@@ -0,0 +1,76 @@
+import random
+
+from interval_utils import intersect_intervals, merge_intervals, subtract_intervals
+
+
+# =====================
+# 整数の集合を使った素朴な実装
+# =====================
+
+def to_set(intervals):
+    return {pos for start, end in intervals for pos in range(start, end + 1)}
+
+
+def to_runs(positions):
+    """整数の集合を、連続する部分ごとの (start, end) に戻す"""
+    runs = []
+    for pos in sorted(positions):
+        if runs and pos == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], pos)
+        else:
+            runs.append((pos, pos))
+    return runs
+
+
+def random_intervals(rng, n, span=200, max_length=30):
+    intervals = []
+    for _ in range(n):
+        start = rng.randint(1, span)
+        intervals.append((start, start + rng.randint(0, max_length)))
+    return intervals
+
+
+# =====================
+# テスト
+# =====================
+
+def test_merge_matches_set():
+    rng = random.Random(0)
+    for _ in range(300):
+        intervals = random_intervals(rng, rng.randint(0, 12))
+        assert merge_intervals(intervals) == to_runs(to_set(intervals))
+
+
+def test_merge_joins_adjacent():
+    assert merge_intervals([(5, 9), (1, 4), (11, 12)]) == [(1, 9), (11, 12)]
+    assert merge_intervals([]) == []
+
+
+def test_subtract_matches_set():
+    rng = random.Random(1)
+    for _ in range(300):
+        intervals = random_intervals(rng, rng.randint(0, 10))
+        removals = random_intervals(rng, rng.randint(0, 10), max_length=15)
+        removed = to_set(removals)
+
+        result = subtract_intervals(intervals, removals)
+        assert len(result) == len(intervals)
+        for interval, pieces in zip(intervals, result):
+            assert pieces == to_runs(to_set([interval]) - removed)
+
+
+def test_subtract_keeps_input_order():
+    intervals = [(50, 60), (1, 10), (5, 55)]
+    assert subtract_intervals(intervals, [(8, 52)]) == [
+        [(53, 60)], [(1, 7)], [(5, 7), (53, 55)],
+    ]
+    assert subtract_intervals(intervals, []) == [[(50, 60)], [(1, 10)], [(5, 55)]]
+    assert subtract_intervals([(3, 4)], [(1, 10)]) == [[]]
+
+
+def test_intersect_matches_set():
+    rng = random.Random(2)
+    for _ in range(300):
+        a = random_intervals(rng, rng.randint(0, 10))
+        b = random_intervals(rng, rng.randint(0, 10))
+        assert intersect_intervals(a, b) == to_runs(to_set(a) & to_set(b))
@@ -0,0 +1,88 @@
+import pytest
+
+from bgzf_utils import read_tabix_linear_index
+from conftest import random_queries, summarize, write_bgzf, write_sorted_gff
+from gff_index import build_region_index, ensure_region_index, iter_region_lines
+from parse_utils import parse_gff_for_region
+
+
+def assert_same_as_scan(gff_file, queries):
+    for seqid, start, end in queries:
+        indexed = parse_gff_for_region(gff_file, seqid, start, end, use_index=True)
+        scanned = parse_gff_for_region(gff_file, seqid, start, end, use_index=False)
+        assert summarize(indexed) == summarize(scanned), (seqid, start, end)
+
+
+# =====================
+# 領域インデックス (.gsreg)
+# =====================
+
+def test_children_sorted_before_parent(data_file):
+    gff_file = data_file("sorted.gff")
+
+    # t2.1 の先頭 exon/UTR は mRNA 行より前、かつクエリのウィンドウより前にある
+    genes = parse_gff_for_region(gff_file, "chr1", 30000, 30500, use_index=True)
+    assert [g.gene_id for g in genes] == ["t2.1", "t2.2"]
+    t21 = summarize(genes)[0][2]
+    assert ("exon", 10000, 10500) in t21
+    assert ("three_prime_UTR", 10000, 10199) in t21
+
+    # 親と同じ開始位置の exon/UTR
+    genes = parse_gff_for_region(gff_file, "chr1", 100, 150, use_index=True)
+    assert ("five_prime_UTR", 100, 199) in summarize(genes)[0][2]
+
+
+def test_fixture_queries_match_scan(data_file):
+    gff_file = data_file("sorted.gff")
+    queries = [("chr1", s, s + w) for s in range(1, 42000, 700) for w in (0, 5000)]
+    queries += [("chr2", 1, 1000), ("chr2", 901, 2000), ("chr3", 1, 1000)]
+    assert_same_as_scan(gff_file, queries)
+
+
+def test_random_queries_match_scan(tmp_path):
+    gff_file = write_sorted_gff(str(tmp_path / "random.gff"), 40)
+    assert build_region_index(gff_file)["sorted"]
+    assert_same_as_scan(gff_file, random_queries(60))
+
+
+def test_unsorted_file_falls_back_to_scan(data_file):
+    gff_file = data_file("sorted.gff")
+    with open(gff_file) as f:
+        lines = f.readlines()
+    with open(gff_file, "w") as f:
+        f.writelines([lines[0]] + lines[:0:-1])
+
+    assert not ensure_region_index(gff_file)["sorted"]
+    assert_same_as_scan(gff_file, [("chr1", 30000, 30500), ("chr1", 100, 150)])
+
+
+# =====================
+# BGZF + .gsreg / tabix (.tbi)
+# =====================
+
+def test_bgzf_queries_match_scan(tmp_path):
+    plain = write_sorted_gff(str(tmp_path / "random.gff"), 40)
+    # 小さいブロックで、行がブロック境界をまたぐようにする
+    gff_file = write_bgzf(plain, str(tmp_path / "random.gff.gz"), block_size=997)
+
+    index = ensure_region_index(gff_file)
+    assert index["sorted"]
+    assert_same_as_scan(gff_file, random_queries(60))
+
+
+def test_tabix_index_matches_scan(tmp_path):
+    pysam = pytest.importorskip("pysam")
+    plain = write_sorted_gff(str(tmp_path / "random.gff"), 40)
+    gff_file = pysam.tabix_index(plain, preset="gff", keep_original=True, force=True)
+
+    linear = read_tabix_linear_index(gff_file + ".tbi")
+    assert set(linear) == {"chr1", "chr2"}
+    assert_same_as_scan(gff_file, random_queries(60))
+
+
+def test_iter_region_lines_stays_on_seqid(data_file):
+    gff_file = data_file("sorted.gff")
+    index = ensure_region_index(gff_file)
+    lines = list(iter_region_lines(gff_file, index, "chr2", 1))
+    assert lines and all(line.startswith("chr2\t") for line in lines)
+    assert list(iter_region_lines(gff_file, index, "chr3", 1)) == []
@@ -0,0 +1,48 @@
+import os
+
+from conftest import random_queries, summarize, write_sorted_gff
+from parse_utils import parse_gff_for_region, parse_gff_for_transcript
+from sqlite_store import AnnotationStore, build_sqlite_store
+
+
+def test_store_is_rollback_journal_and_read_only(data_file, tmp_path):
+    gff_file = data_file("sorted.gff")
+    db_path = str(tmp_path / "sorted.db")
+    build_sqlite_store(gff_file, db_path)
+
+    store = AnnotationStore(db_path)
+    try:
+        assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal"
+        store.get_region("chr1", 30000, 30500)
+    finally:
+        store.close()
+    assert sorted(os.listdir(tmp_path)) == ["sorted.db", "sorted.gff"]
+
+
+def assert_same_as_gff(db_path, gff_file, queries):
+    for seqid, start, end in queries:
+        from_store = parse_gff_for_region(db_path, seqid, start, end)
+        from_gff = parse_gff_for_region(gff_file, seqid, start, end, use_index=False)
+        # 並び順でトラックが決まるので、順序も含めて比較する
+        assert [g.gene_id for g in from_store] == [g.gene_id for g in from_gff], (seqid, start, end)
+        assert summarize(from_store) == summarize(from_gff), (seqid, start, end)
+
+
+def test_store_queries_match_gff(data_file, tmp_path):
+    gff_file = data_file("sorted.gff")
+    db_path = str(tmp_path / "sorted.db")
+    build_sqlite_store(gff_file, db_path)
+
+    assert_same_as_gff(db_path, gff_file, [
+        ("chr1", 30000, 30500), ("chr1", 100, 150), ("chr1", 1, 42000),
+        ("chr2", 1, 1000), ("chr2", 5000, 5000), ("chr2", 1, 9000),
+    ])
+    assert (summarize([parse_gff_for_transcript(db_path, "t2.1")])
+            == summarize([parse_gff_for_transcript(gff_file, "t2.1", use_index=False)]))
+
+
+def test_store_order_on_random_file(tmp_path):
+    gff_file = write_sorted_gff(str(tmp_path / "random.gff"), 40)
+    db_path = str(tmp_path / "random.db")
+    build_sqlite_store(gff_file, db_path)
+    assert_same_as_gff(db_path, gff_file, random_queries(60))
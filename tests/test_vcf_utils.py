@@ -0,0 +1,68 @@
+from conftest import write_bgzf
+from vcf_utils import TranscriptIntervalIndex, classify_variant, iter_vcf_records, load_vcf_variants
+
+TRANSCRIPTS = {
+    # transcript_id: (seqid, start, end, strand, anchor)
+    "tA": ("chr1", 101, 200, "+", 101),
+    "tB": ("chr1", 150, 300, "-", 300),
+}
+
+# 各リストは VCF（ゲノム座標）の順
+EXPECTED = {
+    "tA": {"snps": [10, 21, 70], "insertions": [(30, 2), (70, 2)], "deletions": [(61, 63)]},
+    "tB": {"snps": [131], "insertions": [(130, 2)], "deletions": [(138, 140), (50, 50)]},
+}
+
+
+# =====================
+# classify_variant
+# =====================
+
+def test_snv_and_mnv():
+    assert classify_variant(100, "A", "G") == [("snp", 100)]
+    assert classify_variant(100, "ACGT", "ACCA") == [("snp", 102), ("snp", 103)]
+    assert classify_variant(100, "AC", "AC") == []
+
+
+def test_insertion_position_is_base_before_inserted_sequence():
+    assert classify_variant(100, "A", "ATT") == [("insertion", 100, 2)]
+    assert classify_variant(100, "AC", "ACGGG") == [("insertion", 101, 3)]
+
+
+def test_deletion_drops_padding_base():
+    assert classify_variant(100, "ACGT", "A") == [("deletion", 101, 103)]
+    assert classify_variant(100, "GA", "G") == [("deletion", 101, 101)]
+
+
+def test_symbolic_and_missing_alleles_are_ignored():
+    for alt in (".", "*", "", "<DEL>", "<INS:ME>", "G[chr2:100[", "]chr2:100]G"):
+        assert classify_variant(100, "G", alt) == [], alt
+
+
+# =====================
+# VCF ファイルとの結合
+# =====================
+
+def test_iter_vcf_records_splits_multiallelic(data_file):
+    records = list(iter_vcf_records(data_file("variants.vcf")))
+    assert ("1", 170, "C", ["T", "CAA", "<DEL>", "*"]) in records
+    # 小文字の塩基は大文字にそろえる
+    assert ("chr1", 130, "A", ["AGG"]) in records
+
+
+def test_load_vcf_variants(data_file):
+    assert load_vcf_variants(data_file("variants.vcf"), TRANSCRIPTS) == EXPECTED
+
+
+def test_load_vcf_variants_bgzip(data_file, tmp_path):
+    vcf_file = write_bgzf(data_file("variants.vcf"), str(tmp_path / "variants.vcf.gz"), block_size=97)
+    assert load_vcf_variants(vcf_file, TRANSCRIPTS) == EXPECTED
+
+
+def test_interval_index_overlap_and_aliases():
+    index = TranscriptIntervalIndex({tid: t[:3] for tid, t in TRANSCRIPTS.items()})
+    assert index.resolve_seqid("1") == "chr1"
+    assert index.resolve_seqid("chr2") is None
+    assert index.overlapping("chr1", 90, 100) == []
+    assert sorted(index.overlapping("chr1", 200, 200)) == ["tA", "tB"]
+    assert index.overlapping("chr1", 201, 500) == ["tB"]
@@ -0,0 +1,119 @@
+import numpy as np
+from gene_classes import Insertion, Snp
+from interval_utils import merge_intervals
+
+# =====================
+# バリアント配列 (NumPy)
+# =====================
+
+class VariantStore:
+    """
+    SNPs or insertions of one transcript held as sorted NumPy arrays.
+
+    Iterating yields Snp / Insertion objects, so drawing code can treat a
+    store like the plain lists used when numpy is not installed. Coordinate
+    transforms and deletion filtering operate on the whole array at once.
+
+    Args:
+        positions: Array-like of positions
+        lengths: Array-like of insertion lengths, or None for SNPs
+    """
+
+    __slots__ = ('positions', 'lengths')
+
+    def __init__(self, positions, lengths=None):
+        positions = np.asarray(positions, dtype=np.int64)
+        order = np.argsort(positions, kind='stable')
+        self.positions = positions[order]
+        self.lengths = None if lengths is None else np.asarray(lengths, dtype=np.int64)[order]
+
+    @classmethod
+    def from_snps(cls, snps):
+        """List[Snp] / List[int] / List[list] から作る"""
+        positions = []
+        for s in snps:
+            if isinstance(s, Snp):
+                positions.append(s.position)
+            elif isinstance(s, (list, tuple)) and len(s) >= 1:
+                positions.append(s[0])
+            else:
+                positions.append(s)
+        return cls(positions)
+
+    @classmethod
+    def from_insertions(cls, insertions):
+        """List[Insertion] / List[int] / List[list] から作る"""
+        positions, lengths = [], []
+        for ins in insertions:
+            if isinstance(ins, Insertion):
+                positions.append(ins.position)
+                lengths.append(ins.length)
+            elif isinstance(ins, (list, tuple)) and len(ins) >= 2:
+                positions.append(ins[0])
+                lengths.append(ins[1])
+            else:
+                positions.append(ins)
+                lengths.append(1)
+        return cls(positions, lengths)
+
+    def copy(self):
+        """配列は書き換えずに置き換えるため、共有したまま新しい入れ物を返す"""
+        other = VariantStore.__new__(VariantStore)
+        other.positions = self.positions
+        other.lengths = self.lengths
+        return other
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        if self.lengths is None:
+            for pos in self.positions.tolist():
+                yield Snp(pos)
+        else:
+            for pos, length in zip(self.positions.tolist(), self.lengths.tolist()):
+                yield Insertion(pos, length)
+
+    def to_relative(self, anchor, strand):
+        """anchor を 1 とする座標に変換する（マイナス鎖は向きを反転）"""
+        if strand == '-':
+            # 反転すると降順になるので並びも逆にして昇順を保つ
+            self.positions = (anchor - self.positions + 1)[::-1].copy()
+            if self.lengths is not None:
+                self.lengths = self.lengths[::-1].copy()
+        else:
+            self.positions = self.positions - anchor + 1
+
+    def remove_deleted(self, deletion_regions):
+        """デリーション領域 (start <= pos <= end) に含まれるバリアントを取り除く"""
+        merged = merge_intervals((d.start, d.end) for d in deletion_regions)
+        if not merged or not len(self.positions):
+            return
+        starts = np.array([s for s, _ in merged], dtype=np.int64)
+        ends = np.array([e for _, e in merged], dtype=np.int64)
+
+        idx = np.searchsorted(starts, self.positions, side='right') - 1
+        inside = (idx >= 0) & (self.positions <= ends[np.maximum(idx, 0)])
+        keep = ~inside
+        self.positions = self.positions[keep]
+        if self.lengths is not None:
+            self.lengths = self.lengths[keep]
+
+    def extent(self):
+        """(最小座標, 最大座標)。空なら None"""
+        if not len(self.positions):
+            return None
+        if self.lengths is None:
+            return int(self.positions[0]), int(self.positions[-1])
+        return int(self.positions[0]), int((self.positions + self.lengths - 1).max())
+
+    def histogram(self, origin, bin_width):
+        """
+        Count variants per bin of bin_width bp starting at origin.
+
+        Returns:
+            List[tuple]: (bin_index, count) for the non-empty bins, in order
+        """
+        bins = np.floor((self.positions - origin) / bin_width).astype(np.int64)
+        index, counts = np.unique(bins, return_counts=True)
+        return list(zip(index.tolist(), counts.tolist()))
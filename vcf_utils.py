@@ -0,0 +1,154 @@
+from bisect import bisect_right
+from bgzf_utils import iter_lines
+
+# =====================
+# VCF 読み込み
+# =====================
+
+def iter_vcf_records(vcf_file):
+    """
+    Stream the records of a plain, gzip or bgzip VCF.
+
+    Yields:
+        (chrom, pos, ref, alts): pos is 1-based, alts is a list of ALT alleles
+    """
+    for line in iter_lines(vcf_file, desc="Reading VCF"):
+        if line.startswith("#"):
+            continue
+        parts = line.rstrip("\r\n").split("\t", 5)
+        if len(parts) < 5:
+            continue
+        chrom, pos, _, ref, alt = parts[:5]
+        yield chrom, int(pos), ref.upper(), alt.upper().split(",")
+
+
+def classify_variant(pos, ref, alt):
+    """
+    Classify one REF/ALT pair by its genomic effect.
+
+    Returns:
+        List of ('snp', position) / ('insertion', position, length) /
+        ('deletion', start, end). The insertion position is the base after
+        which the sequence is inserted. Symbolic or missing alleles give [].
+    """
+    if not alt or alt in (".", "*") or alt.startswith("<") or "[" in alt or "]" in alt:
+        return []
+
+    # 共通の先頭塩基（パディング塩基）を取り除く
+    prefix = 0
+    while prefix < min(len(ref), len(alt)) and ref[prefix] == alt[prefix]:
+        prefix += 1
+
+    if len(ref) == len(alt):
+        # SNV / MNV: 異なる塩基ごとに SNP とする
+        return [('snp', pos + i) for i in range(len(ref)) if ref[i] != alt[i]]
+    if len(alt) > len(ref):
+        return [('insertion', pos + prefix - 1, len(alt) - len(ref))]
+    return [('deletion', pos + prefix, pos + prefix + len(ref) - len(alt) - 1)]
+
+
+class TranscriptIntervalIndex:
+    """
+    Sorted per-sequence index of transcript extents for joining variants.
+
+    Args:
+        extents: {transcript_id: (seqid, start, end)} in genomic coordinates
+    """
+
+    def __init__(self, extents):
+        by_seqid = {}
+        for transcript_id, (seqid, start, end) in extents.items():
+            by_seqid.setdefault(seqid, []).append((start, end, transcript_id))
+
+        self._starts = {}
+        self._entries = {}
+        self._max_length = {}
+        for seqid, entries in by_seqid.items():
+            entries.sort()
+            self._entries[seqid] = entries
+            self._starts[seqid] = [e[0] for e in entries]
+            self._max_length[seqid] = max(e[1] - e[0] for e in entries)
+        self._aliases = {}
+
+    def resolve_seqid(self, chrom):
+        """VCF 側の染色体名を GFF 側の名前に合わせる（"chr1" と "1" の違いを吸収）"""
+        seqid = self._aliases.get(chrom)
+        if seqid is None:
+            seqid = chrom
+            if chrom not in self._entries:
+                alt_name = chrom[3:] if chrom.startswith("chr") else "chr" + chrom
+                if alt_name in self._entries:
+                    seqid = alt_name
+            self._aliases[chrom] = seqid
+        return seqid if seqid in self._entries else None
+
+    def overlapping(self, seqid, start, end):
+        """seqid:start-end と重なる transcript ID のリスト"""
+        starts = self._starts.get(seqid)
+        if starts is None:
+            return []
+        entries = self._entries[seqid]
+        hi = bisect_right(starts, end)
+        # 最長の transcript より前から始まるものは重ならない
+        lo = bisect_right(starts, start - self._max_length[seqid] - 1)
+        return [tid for s, e, tid in entries[lo:hi] if e >= start]
+
+
+def to_relative_position(pos, anchor, strand):
+    if strand == '-':
+        return anchor - pos + 1
+    return pos - anchor + 1
+
+
+def load_vcf_variants(vcf_file, transcripts):
+    """
+    Collect the variants of a VCF that fall on the given transcripts, in
+    each transcript's relative coordinate frame.
+
+    The VCF is streamed once; only variants overlapping a transcript are
+    kept in memory.
+
+    Args:
+        vcf_file: Path to a plain or bgzip-compressed VCF
+        transcripts: {transcript_id: (seqid, start, end, strand, anchor)}
+                     with start/end/anchor in genomic coordinates (anchor
+                     as set by GeneStructure.to_relative())
+
+    Returns:
+        dict: {transcript_id: {"snps": [...], "insertions": [(pos, length), ...],
+                               "deletions": [(start, end), ...]}}
+    """
+    index = TranscriptIntervalIndex({tid: t[:3] for tid, t in transcripts.items()})
+    collected = {}
+
+    for chrom, pos, ref, alts in iter_vcf_records(vcf_file):
+        seqid = index.resolve_seqid(chrom)
+        if seqid is None:
+            continue
+        tids = index.overlapping(seqid, pos, pos + len(ref) - 1)
+        if not tids:
+            continue
+
+        for alt in alts:
+            for variant in classify_variant(pos, ref, alt):
+                for tid in tids:
+                    collected.setdefault(tid, set()).add(variant)
+
+    variants = {}
+    for tid, genomic in collected.items():
+        _, _, _, strand, anchor = transcripts[tid]
+        snps, insertions, deletions = [], [], []
+        for variant in sorted(genomic):
+            kind = variant[0]
+            if kind == 'snp':
+                snps.append(to_relative_position(variant[1], anchor, strand))
+            elif kind == 'insertion':
+                # マイナス鎖では転写方向で挿入位置の直前になる塩基 (pos + 1) を基準にする
+                base = variant[1] + 1 if strand == '-' else variant[1]
+                insertions.append((to_relative_position(base, anchor, strand), variant[2]))
+            else:
+                s = to_relative_position(variant[1], anchor, strand)
+                e = to_relative_position(variant[2], anchor, strand)
+                deletions.append((min(s, e), max(s, e)))
+        variants[tid] = {"snps": snps, "insertions": insertions, "deletions": deletions}
+    return variants